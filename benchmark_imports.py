@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import typer
+from rich import box
+from rich.console import Console
+from rich.table import Table
+
+from common import ERROR_ICON, SPINNER_ICON, SUCCESS_ICON
+
+# Entry points whose cold start is measured.
+ENTRY_POINTS = ["updater", "generate_previews"]
+
+# Heavy modules the entry points only import on the code paths that need them.
+DEFERRED_MODULES = [
+    "requests",
+    "rich.progress",
+    "rich.prompt",
+    "rich.syntax",
+    "PIL",
+    "numpy",
+    "fontTools",
+]
+
+app = typer.Typer()
+console = Console()
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, int, str]]:
+    """Parses the output of -X importtime into (self us, cumulative us, name) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append((int(self_us), int(cumulative_us), name[1:].rstrip()))
+    return rows
+
+
+def measure_import(module: str, cwd: Path) -> Tuple[float, List[Tuple[int, int, str]]]:
+    """
+    Imports module in a fresh interpreter.
+
+    Returns:
+        tuple: The cumulative import time in ms, and the importtime rows of
+               the module and everything it imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr}")
+    rows = parse_importtime(result.stderr)
+    # Rows are printed after their children, so the module's own imports are
+    # the indented rows right above it
+    end = max(i for i, (_, _, name) in enumerate(rows) if name == module)
+    start = end
+    while start > 0 and rows[start - 1][2].startswith(" "):
+        start -= 1
+    return rows[end][1] / 1000, rows[start : end + 1]
+
+
+def measure_help(module: str, cwd: Path) -> float:
+    """Runs the entry point with --help in a fresh interpreter, returning its wall time in ms."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, f"{module}.py", "--help"],
+        cwd=cwd,
+        capture_output=True,
+        check=True,
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+@app.command()
+def main(
+    repeat: int = typer.Option(
+        5,
+        "--repeat",
+        min=1,
+        help="Cold starts per entry point; the fastest is checked against the budget",
+    ),
+    budget: float = typer.Option(
+        120.0,
+        "--budget",
+        min=0,
+        help="Import-time budget per entry point, in milliseconds",
+    ),
+    top: int = typer.Option(
+        3, "--top", min=0, help="Number of heaviest direct imports to list"
+    ),
+    json_output: Optional[str] = typer.Option(
+        None, "--json", help="Also write the results to this JSON file"
+    ),
+):
+    """Check the cold-start import time of the entry points with python -X importtime."""
+
+    repo_dir = Path(__file__).resolve().parent
+    results = []
+    for module in ENTRY_POINTS:
+        console.print(
+            f"[dim]{SPINNER_ICON}Importing {module} {repeat} times[white]...[/white][/dim]"
+        )
+        imports = [measure_import(module, repo_dir) for _ in range(repeat)]
+        totals = [total for total, _ in imports]
+        _, rows = min(imports, key=lambda i: i[0])
+        loaded = {name.strip() for _, _, name in rows}
+        # Direct imports of the entry point are indented by exactly one level
+        direct: Dict[str, float] = {
+            name.strip(): cumulative / 1000
+            for _, cumulative, name in rows
+            if name.startswith("  ") and not name.startswith("    ")
+        }
+        results.append(
+            {
+                "entry_point": module,
+                "import_ms": min(totals),
+                "import_p50_ms": statistics.median(totals),
+                "help_ms": min(measure_help(module, repo_dir) for _ in range(repeat)),
+                "heaviest": sorted(direct.items(), key=lambda i: i[1], reverse=True)[
+                    :top
+                ],
+                "deferred_loaded": [
+                    m
+                    for m in DEFERRED_MODULES
+                    if any(name == m or name.startswith(f"{m}.") for name in loaded)
+                ],
+            }
+        )
+
+    table = Table(
+        "Entry Point",
+        "Import (ms)",
+        "p50 (ms)",
+        "--help (ms)",
+        "Heaviest Imports (ms)",
+        "Eagerly Loaded",
+        title=f"Cold Start (budget {budget:.0f} ms)",
+        box=box.ROUNDED,
+    )
+    for r in results:
+        over = r["import_ms"] > budget
+        table.add_row(
+            r["entry_point"],
+            f"[{'red' if over else 'green'}]{r['import_ms']:.1f}[/]",
+            f"{r['import_p50_ms']:.1f}",
+            f"{r['help_ms']:.1f}",
+            "\n".join(f"{name} {ms:.1f}" for name, ms in r["heaviest"]),
+            (
+                f"[red]{', '.join(r['deferred_loaded'])}[/red]"
+                if r["deferred_loaded"]
+                else "-"
+            ),
+        )
+    console.print(table)
+
+    if json_output:
+        Path(json_output).write_text(json.dumps(results, indent=2) + "\n")
+        console.print(f"[green]{SUCCESS_ICON}Wrote results to {json_output}[/green]")
+
+    failures = [
+        r["entry_point"]
+        for r in results
+        if r["import_ms"] > budget or r["deferred_loaded"]
+    ]
+    if failures:
+        console.print(
+            f"[red]{ERROR_ICON}Over budget or eagerly loading deferred modules: {', '.join(failures)}[/red]"
+        )
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import typer
+from rich import box
+from rich.console import Console
+from rich.table import Table
+from typer.testing import CliRunner
+
+import generate_previews
+from common import ERROR_ICON, SPINNER_ICON, SUCCESS_ICON
+
+# A stand-in for silicon: drains stdin, sleeps, then writes a 1x1 PNG or fails.
+STUB_SILICON = """\
+#!{python}
+import os, random, struct, sys, time, zlib
+
+def chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+args = sys.argv[1:]
+output = args[args.index("--output") + 1]
+if "--language" in args:
+    sys.stdin.read()
+time.sleep(float(os.environ.get("STUB_SILICON_LATENCY", "0")))
+if random.random() < float(os.environ.get("STUB_SILICON_FAILURE_RATE", "0")):
+    sys.stderr.write("stub failure\\n")
+    sys.exit(1)
+with open(output, "wb") as f:
+    f.write(b"\\x89PNG\\r\\n\\x1a\\n")
+    f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 6, 0, 0, 0)))
+    f.write(chunk(b"IDAT", zlib.compress(b"\\x00\\x00\\x00\\x00\\x00")))
+    f.write(chunk(b"IEND", b""))
+"""
+
+# A stand-in for fc-match, resolving every pattern to a dummy font file.
+STUB_FC_MATCH = """\
+#!/bin/sh
+printf %s "{font_file}"
+"""
+
+
+# Runs a single configuration in a fresh interpreter and prints its results.
+RUN_ONCE_SCRIPT = """\
+import json, sys
+from pathlib import Path
+from benchmark_previews import run_once
+source_dir, theme_dir, output_dir, jobs = sys.argv[1:]
+print(json.dumps(run_once(Path(source_dir), Path(theme_dir), Path(output_dir), int(jobs))))
+"""
+
+# ru_maxrss is in KiB on Linux but in bytes on macOS.
+RU_MAXRSS_BYTES = 1 if sys.platform == "darwin" else 1024
+
+app = typer.Typer()
+console = Console()
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def parse_matrix_list(value: str) -> List[Tuple[int, int]]:
+    """Parses "1x4,2x11" into [(1, 4), (2, 11)] (sources x themes)."""
+    matrix = []
+    for item in value.split(","):
+        sources, themes = item.strip().lower().split("x")
+        matrix.append((int(sources), int(themes)))
+    return matrix
+
+
+def install_stubs(bin_dir: Path):
+    """Writes stub silicon and fc-match executables into bin_dir."""
+    font_file = bin_dir / "stub-font.ttf"
+    font_file.write_bytes(b"stub font")
+    for name, script in (
+        ("silicon", STUB_SILICON.format(python=sys.executable)),
+        ("fc-match", STUB_FC_MATCH.format(font_file=font_file)),
+    ):
+        stub = bin_dir / name
+        stub.write_text(script)
+        stub.chmod(0o755)
+
+
+def make_matrix(
+    work_dir: Path, sources: int, themes: int, source_dir: Path, theme_dir: Path
+) -> Tuple[Path, Path]:
+    """Populates synthetic source and theme directories by cycling the real ones."""
+    real_sources = sorted(f for f in source_dir.iterdir() if f.is_file())
+    real_themes = sorted(f for f in theme_dir.iterdir() if f.is_file())
+    matrix_sources = work_dir / f"sources_{sources}x{themes}"
+    matrix_themes = work_dir / f"themes_{sources}x{themes}"
+    matrix_sources.mkdir()
+    matrix_themes.mkdir()
+    for i in range(sources):
+        real = real_sources[i % len(real_sources)]
+        shutil.copy(real, matrix_sources / f"{real.stem}{i}{real.suffix}")
+    for i in range(themes):
+        real = real_themes[i % len(real_themes)]
+        shutil.copy(real, matrix_themes / f"{real.stem}{i}{real.suffix}")
+    return matrix_sources, matrix_themes
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def run_once(
+    source_dir: Path, theme_dir: Path, output_dir: Path, jobs: int
+) -> Dict[str, float]:
+    """Runs generate_previews.main() once, timing every process_source_file call."""
+    latencies: List[float] = []
+    lock = threading.Lock()
+    original = generate_previews.process_source_file
+
+    def timed_process_source_file(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    generate_previews.process_source_file = timed_process_source_file
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        result = CliRunner().invoke(
+            generate_previews.app,
+            [
+                "--source",
+                str(source_dir),
+                "--theme",
+                str(theme_dir),
+                "--output",
+                str(output_dir),
+                "--version",
+                "0.0.0",
+                "--jobs",
+                str(jobs),
+                "--force",
+            ],
+        )
+    finally:
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        generate_previews.process_source_file = original
+
+    if result.exception and not isinstance(result.exception, SystemExit):
+        raise result.exception
+
+    # The largest resident set of this process and of any single child it
+    # waited for, like silicon; unlike tracemalloc, these count native memory
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "renders": len(latencies),
+        "wall_s": wall,
+        "throughput": len(latencies) / wall if wall > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "peak_mem_mb": peak / (1 << 20),
+        "peak_rss_mb": self_usage.ru_maxrss * RU_MAXRSS_BYTES / (1 << 20),
+        "peak_child_rss_mb": children_usage.ru_maxrss * RU_MAXRSS_BYTES / (1 << 20),
+    }
+
+
+def run_isolated(
+    source_dir: Path, theme_dir: Path, output_dir: Path, jobs: int
+) -> Dict[str, float]:
+    """Runs run_once() in a fresh interpreter, so its peak RSS covers that run alone."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            RUN_ONCE_SCRIPT,
+            str(source_dir),
+            str(theme_dir),
+            str(output_dir),
+            str(jobs),
+        ],
+        cwd=Path(__file__).resolve().parent,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"benchmark run failed:\n{result.stderr}")
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@app.command()
+def main(
+    matrix: str = typer.Option(
+        "1x4,1x11,2x22",
+        "--matrix",
+        help="Comma-separated matrix sizes to sweep, as <sources>x<themes>",
+    ),
+    jobs: str = typer.Option(
+        "1,2,4,8",
+        "--jobs",
+        help="Comma-separated concurrency levels to sweep",
+    ),
+    latency: float = typer.Option(
+        0.05,
+        "--latency",
+        min=0,
+        help="Seconds the stub silicon sleeps per render",
+    ),
+    failure_rate: float = typer.Option(
+        0.0,
+        "--failure-rate",
+        min=0,
+        max=1,
+        help="Probability that a stub silicon render fails",
+    ),
+    repeat: int = typer.Option(
+        3,
+        "--repeat",
+        min=1,
+        help="Runs per configuration; the fastest run is reported",
+    ),
+    source: str = typer.Option(
+        "./preview/sources", "--source", help="Directory of real source files"
+    ),
+    theme: str = typer.Option(
+        "./preview/themes", "--theme", help="Directory of real theme files"
+    ),
+    json_output: Optional[str] = typer.Option(
+        None, "--json", help="Also write the results to this JSON file"
+    ),
+):
+    """Benchmark generate_previews.py against a stub silicon, without network or fonts."""
+
+    source_path = Path(source)
+    theme_path = Path(theme)
+    if not source_path.is_dir() or not theme_path.is_dir():
+        console.print(
+            f"[red]{ERROR_ICON}Source or theme directory not found: {source_path}, {theme_path}[/red]"
+        )
+        raise typer.Exit(1)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="benchmark-previews-") as tmp:
+        work_dir = Path(tmp)
+        bin_dir = work_dir / "bin"
+        bin_dir.mkdir()
+        install_stubs(bin_dir)
+
+        old_env = {
+            k: os.environ.get(k)
+            for k in ("PATH", "STUB_SILICON_LATENCY", "STUB_SILICON_FAILURE_RATE")
+        }
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+        os.environ["STUB_SILICON_LATENCY"] = str(latency)
+        os.environ["STUB_SILICON_FAILURE_RATE"] = str(failure_rate)
+        try:
+            for sources, themes in parse_matrix_list(matrix):
+                matrix_sources, matrix_themes = make_matrix(
+                    work_dir, sources, themes, source_path, theme_path
+                )
+                for job_count in parse_int_list(jobs):
+                    console.print(
+                        f"[dim]{SPINNER_ICON}Running {sources}x{themes} with {job_count} jobs[white]...[/white][/dim]"
+                    )
+                    output_dir = work_dir / f"out_{sources}x{themes}_{job_count}"
+                    runs = [
+                        run_isolated(
+                            matrix_sources, matrix_themes, output_dir, job_count
+                        )
+                        for _ in range(repeat)
+                    ]
+                    best = min(runs, key=lambda r: r["wall_s"])
+                    results.append(
+                        {"matrix": f"{sources}x{themes}", "jobs": job_count, **best}
+                    )
+        finally:
+            for k, v in old_env.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+
+    table = Table(
+        "Matrix",
+        "Jobs",
+        "Renders",
+        "Wall (s)",
+        "Renders/s",
+        "p50 (ms)",
+        "p95 (ms)",
+        "Peak Py mem (MiB)",
+        "Peak RSS (MiB)",
+        "Child RSS (MiB)",
+        title=f"Preview Pipeline (stub latency {latency * 1000:.0f} ms, failure rate {failure_rate:.0%})",
+        box=box.ROUNDED,
+    )
+    for r in results:
+        table.add_row(
+            r["matrix"],
+            str(r["jobs"]),
+            str(r["renders"]),
+            f"{r['wall_s']:.3f}",
+            f"{r['throughput']:.1f}",
+            f"{r['p50_ms']:.1f}",
+            f"{r['p95_ms']:.1f}",
+            f"{r['peak_mem_mb']:.2f}",
+            f"{r['peak_rss_mb']:.1f}",
+            f"{r['peak_child_rss_mb']:.1f}",
+        )
+    console.print(table)
+
+    if json_output:
+        Path(json_output).write_text(json.dumps(results, indent=2) + "\n")
+        console.print(f"[green]{SUCCESS_ICON}Wrote results to {json_output}[/green]")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+
+import typer
+
+# requests is imported where it's used, so that paths which never touch the
+# network, like --help or a fully cached run, don't pay for loading it.
+if TYPE_CHECKING:
+    import requests
+    from rich.console import Console
+
+# Overridable to point the scripts at a stand-in server.
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+# Root of everything the scripts cache between runs.
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "iosevkata"
+# Conditional-request cache of GitHub API responses, keyed by URL and token.
+HTTP_CACHE_DIR = CACHE_DIR / "http"
+HTTP_POOL_SIZE = 16
+HTTP_TIMEOUT = 10  # seconds
+# Largest page size of GitHub's list endpoints.
+GITHUB_PAGE_SIZE = 100
+
+ERROR_ICON = "󰅙 "
+WARNING_ICON = " "
+SUCCESS_ICON = "󰗠 "
+INFO_ICON = "󰋼 "
+HINT_ICON = "󰌵 "
+SPINNER_ICON = " "
+
+
+def write_json_atomic(path: Path, data: Any, indent: Optional[int] = 2):
+    """Writes JSON to a temporary file next to path, then renames it into place."""
+    with tempfile.NamedTemporaryFile(
+        mode="w", dir=path.parent, suffix=".tmp", delete=False
+    ) as tmp_file:
+        json.dump(data, tmp_file, indent=indent)
+        tmp_file.write("\n")
+    os.replace(tmp_file.name, path)
+
+
+class GitHubClient:
+    """
+    A pooled GitHub API client that revalidates cached responses.
+
+    Responses are cached on disk with their ETag and Last-Modified headers
+    and revalidated with If-None-Match/If-Modified-Since, so an unchanged
+    resource costs a 304, which doesn't count against the rate limit.
+    Requests are authenticated with the token, when there is one. The size
+    of every response body is passed to on_transfer, when it's set.
+    """
+
+    def __init__(self, token: Optional[str] = None, cache_dir: Path = HTTP_CACHE_DIR):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.token = token
+        self.cache_dir = cache_dir
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self.on_transfer: Optional[Callable[[int], None]] = None
+
+    def record_transfer(self, response: "requests.Response"):
+        if self.on_transfer is not None:
+            self.on_transfer(len(response.content))
+
+    def api_headers(self) -> Dict[str, str]:
+        headers = {
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+        }
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def cache_file(self, url: str) -> Path:
+        # Responses vary by credentials, so the token is part of the key
+        key = hashlib.sha256(f"{url}\0{self.token or ''}".encode()).hexdigest()
+        return self.cache_dir / f"{key}.json"
+
+    def get_json(self, url: str, timeout: float = HTTP_TIMEOUT) -> Any:
+        """GETs a GitHub API URL (or a path under it) as JSON, revalidating the cached copy."""
+        if url.startswith("/"):
+            url = f"{GITHUB_API_URL}{url}"
+        cache_file = self.cache_file(url)
+        try:
+            cached = json.loads(cache_file.read_text())
+        except (OSError, ValueError):
+            cached = None
+
+        headers = self.api_headers()
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        self.record_transfer(response)
+        if response.status_code == 304 and cached is not None:
+            return cached["body"]
+        response.raise_for_status()
+        body = response.json()
+
+        if "ETag" in response.headers or "Last-Modified" in response.headers:
+            entry = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "body": body,
+            }
+            try:
+                with self._lock:
+                    self.cache_dir.mkdir(parents=True, exist_ok=True)
+                    write_json_atomic(cache_file, entry, indent=None)
+            except OSError:
+                # The cache is an optimization only
+                pass
+        return body
+
+    def graphql(self, query: str, timeout: float = HTTP_TIMEOUT) -> Dict[str, Any]:
+        """POSTs a GraphQL query and returns its data. GraphQL requires a token."""
+        import requests
+
+        response = self.session.post(
+            f"{GITHUB_API_URL}/graphql",
+            json={"query": query},
+            headers=self.api_headers(),
+            timeout=timeout,
+        )
+        self.record_transfer(response)
+        response.raise_for_status()
+        result = response.json()
+        if result.get("errors"):
+            messages = "; ".join(e.get("message", str(e)) for e in result["errors"])
+            raise requests.RequestException(f"GraphQL query failed: {messages}")
+        return result["data"]
+
+
+@lru_cache(maxsize=None)
+def get_github_client() -> GitHubClient:
+    """Returns the process-wide GitHub client, authenticated with $GITHUB_TOKEN if set."""
+    return GitHubClient(token=os.environ.get("GITHUB_TOKEN") or None)
+
+
+def get_latest_github_release(github_repo: str, console: "Console") -> str:
+    import requests
+
+    repo_url = f"{GITHUB_API_URL}/repos/{github_repo}/releases/latest"
+    console.print(
+        f"[dim]{SPINNER_ICON}Fetching latest tag for [blue][link={repo_url}]{github_repo}[/link][/blue][white]...[/white][/dim]"
+    )
+    try:
+        release = get_github_client().get_json(repo_url)
+        tag = release["tag_name"]
+        return tag.lstrip("v")
+    except requests.Timeout:
+        console.print(
+            f"[red]{ERROR_ICON}Timeout while fetching tag for {github_repo} from {repo_url}[/red]"
+        )
+        raise typer.Exit(1)
+    except requests.RequestException as e:
+        console.print(
+            f"[red]{ERROR_ICON}Error fetching tag for {github_repo}: {e}[/red]"
+        )
+        raise typer.Exit(1)
+    except (KeyError, TypeError):
+        console.print(
+            f"[red]{ERROR_ICON}Error: 'tag_name' not found in response for {github_repo}. Response: {release}[/red]"
+        )
+        raise typer.Exit(1)
+
+
+def get_latest_github_releases(github_repos: List[str]) -> Dict[str, str]:
+    """
+    Resolves the latest release of several repositories in one round-trip.
+
+    With a token, all repositories are resolved by a single batched GraphQL
+    query. Without one, the REST lookups fan out in parallel instead.
+
+    Returns:
+        dict: The latest version (without the "v" prefix) of each repository.
+    """
+    client = get_github_client()
+    if client.token:
+        fields = "\n".join(
+            f"  repo{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ latestRelease {{ tagName }} }}"
+            for i, (owner, name) in enumerate(
+                repo.split("/", 1) for repo in github_repos
+            )
+        )
+        data = client.graphql(f"query {{\n{fields}\n}}")
+        return {
+            repo: data[f"repo{i}"]["latestRelease"]["tagName"].lstrip("v")
+            for i, repo in enumerate(github_repos)
+        }
+
+    with ThreadPoolExecutor(max_workers=len(github_repos)) as executor:
+        releases = executor.map(
+            lambda repo: client.get_json(f"/repos/{repo}/releases/latest"),
+            github_repos,
+        )
+        return {
+            repo: release["tag_name"].lstrip("v")
+            for repo, release in zip(github_repos, releases)
+        }
+
+
+def iter_github_release_pages(github_repo: str) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yields the releases of a repository a page at a time, newest first.
+
+    Pages are fetched as they are consumed, so callers can stop early.
+    """
+    client = get_github_client()
+    page = 1
+    while True:
+        releases = client.get_json(
+            f"/repos/{github_repo}/releases?per_page={GITHUB_PAGE_SIZE}&page={page}"
+        )
+        yield releases
+        if len(releases) < GITHUB_PAGE_SIZE:
+            return
+        page += 1
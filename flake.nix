@@ -150,6 +150,10 @@
               pkgs.silicon
               (pkgs.python3.withPackages (ps: [
                 ps.fontforge
+                ps.fonttools
+                ps.numpy
+                ps.pillow
+                ps.pygments
                 ps.requests
                 ps.rich
                 ps.typer
@@ -1,105 +1,1219 @@
 #!/usr/bin/env python3
 
+import ctypes
+import hashlib
+import json
+import os
+import plistlib
+import select
+import shutil
+import statistics
+import struct
 import subprocess
+import sys
 import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from datetime import datetime, timezone
+from enum import Enum
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
 
-import requests
 import typer
 from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn
+from rich import box
 from rich.panel import Panel
+from rich.table import Table
 from rich.text import Text
 
-ERROR_ICON = "󰅙 "
-WARNING_ICON = " "
-SUCCESS_ICON = "󰗠 "
-INFO_ICON = "󰋼 "
-HINT_ICON = "󰌵 "
-SPINNER_ICON = " "
+from common import (
+    CACHE_DIR,
+    ERROR_ICON,
+    INFO_ICON,
+    SUCCESS_ICON,
+    WARNING_ICON,
+    get_latest_github_release,
+    write_json_atomic,
+)
+
+# Per-render timeout for a single silicon invocation, in seconds.
+DEFAULT_RENDER_TIMEOUT = 120
+
+# Font used for previews, and the silicon flags shared by every render.
+PREVIEW_FONT_FAMILY = "Iosevkata Nerd Font"
+PREVIEW_FONT_SIZE = 48
+SILICON_ARGS = [
+    "--pad-horiz",
+    "0",
+    "--pad-vert",
+    "0",
+    "--background",
+    "#fff0",
+    "--font",
+    f"{PREVIEW_FONT_FAMILY}={PREVIEW_FONT_SIZE}",
+    "--no-window-controls",
+    "--no-round-corner",
+]
+
+# Manifest of rendered previews, kept in the output directory.
+RENDER_CACHE_FILENAME = ".render-cache.json"
+RENDER_CACHE_VERSION = 1
+
+# Compiled tmTheme style tables, keyed by the digest of the theme file.
+THEME_CACHE_DIR = CACHE_DIR / "themes"
+THEME_CACHE_VERSION = 1
+
+# Subsets of the preview font, keyed by the font digest and the codepoints kept.
+FONT_SUBSET_DIR = CACHE_DIR / "subsets"
+
+# Layout of the native renderer, mirroring silicon's defaults.
+NATIVE_CODE_PAD = 25
+NATIVE_LINE_PAD = 2
+NATIVE_TAB_WIDTH = 4
+
+# TextMate scopes for Pygments token types, looked up from the most specific
+# token type to its parents.
+PYGMENTS_TOKEN_SCOPES = {
+    "Comment": "comment",
+    "Comment.Preproc": "meta.preprocessor",
+    "Keyword": "keyword",
+    "Keyword.Constant": "constant.language",
+    "Keyword.Declaration": "storage.type",
+    "Keyword.Namespace": "keyword.control.import",
+    "Keyword.Reserved": "storage.modifier",
+    "Keyword.Type": "storage.type",
+    "Name.Attribute": "entity.other.attribute-name",
+    "Name.Builtin": "support.function",
+    "Name.Builtin.Pseudo": "variable.language",
+    "Name.Class": "entity.name.type",
+    "Name.Constant": "constant.other",
+    "Name.Decorator": "meta.annotation",
+    "Name.Entity": "entity.name",
+    "Name.Exception": "entity.name.type",
+    "Name.Function": "entity.name.function",
+    "Name.Function.Magic": "support.function",
+    "Name.Label": "entity.name.label",
+    "Name.Namespace": "entity.name.namespace",
+    "Name.Tag": "entity.name.tag",
+    "Name.Variable": "variable",
+    "Literal.Number": "constant.numeric",
+    "Literal.String": "string",
+    "Literal.String.Char": "constant.character",
+    "Literal.String.Escape": "constant.character.escape",
+    "Literal.String.Interpol": "punctuation.section.embedded",
+    "Literal.String.Regex": "string.regexp",
+    "Operator": "keyword.operator",
+    "Operator.Word": "keyword.operator",
+    "Punctuation": "punctuation",
+    "Generic.Deleted": "markup.deleted",
+    "Generic.Emph": "markup.italic",
+    "Generic.Heading": "markup.heading",
+    "Generic.Inserted": "markup.inserted",
+    "Generic.Strong": "markup.bold",
+}
+
+
+# Encoder settings of preview derivatives, see write_derivatives().
+DERIVATIVE_SAVE_OPTIONS: Dict[str, Dict[str, Any]] = {
+    "png": {"format": "PNG", "optimize": True},
+    "webp": {"format": "WEBP", "lossless": True, "method": 6},
+    "avif": {"format": "AVIF", "quality": 90, "speed": 4},
+}
+
+# inotify(7) event masks, see /usr/include/linux/inotify.h.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")
+
+# Layout of contact sheets, in pixels.
+CONTACT_SHEET_GAP = 32
+CONTACT_SHEET_LABEL_HEIGHT = 64
+CONTACT_SHEET_LABEL_COLOR = (128, 128, 128, 255)
+
+# Font directories of a build (dist/Iosevkata) that get glyph specimens, and
+# their layout: grayscale, in pixels, rasterized SPECIMEN_BATCH_ROWS at a time.
+SPECIMEN_FONT_DIRS = ["TTF", "NerdFont", "NerdFontMono", "SymbolsNerdFont"]
+SPECIMEN_FONT_SIZE = 32
+SPECIMEN_COLUMNS = 64
+SPECIMEN_BATCH_ROWS = 16
+SPECIMEN_PAD = 8
+SPECIMEN_LABEL_WIDTH = 160
+SPECIMEN_LABEL_LEVEL = 128
+SPECIMEN_GRID_LEVEL = 224
+
+
+class Backend(str, Enum):
+    SILICON = "silicon"
+    NATIVE = "native"
 
 
 app = typer.Typer()
 console = Console()
 
 
-def get_latest_github_release(github_repo: str) -> str:
-    repo_url = f"https://api.github.com/repos/{github_repo}/releases/latest"
-    console.print(
-        f"[dim]{SPINNER_ICON}Fetching latest tag for [blue][link={repo_url}]{github_repo}[/link][/blue][white]...[/white][/dim]"
-    )
+# Trace events in the Chrome trace-event format, recorded when --trace is set.
+_trace_events: Optional[List[Dict[str, Any]]] = None
+_trace_lock = threading.Lock()
+_trace_origin = time.perf_counter()
+
+
+def enable_tracing():
+    global _trace_events, _trace_origin
+    _trace_events = []
+    _trace_origin = time.perf_counter()
+
+
+@contextmanager
+def trace_span(name: str, category: str, **args: Any) -> Iterator[None]:
+    """Records a complete ("X") trace event around a block or function, if tracing."""
+    if _trace_events is None:
+        yield
+        return
+    start = time.perf_counter()
     try:
-        response = requests.get(repo_url, timeout=10)
-        response.raise_for_status()
-        tag = response.json()["tag_name"]
-        return tag.lstrip("v")
-    except requests.Timeout:
-        console.print(
-            f"[red]{ERROR_ICON}Timeout while fetching tag for {github_repo} from {repo_url}[/red]"
+        yield
+    finally:
+        end = time.perf_counter()
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - _trace_origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": {"thread": thread.name, **args},
+        }
+        with _trace_lock:
+            _trace_events.append(event)
+
+
+def write_trace(trace_file: Path):
+    """Writes recorded spans as Chrome trace-event JSON and prints a summary table."""
+    events = list(_trace_events or [])
+    threads = {(e["pid"], e["tid"]): e["args"]["thread"] for e in events}
+    metadata = [
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": pid,
+            "tid": tid,
+            "args": {"name": name},
+        }
+        for (pid, tid), name in threads.items()
+    ]
+    trace_file.write_text(
+        json.dumps({"traceEvents": metadata + events, "displayTimeUnit": "ms"})
+    )
+
+    durations: Dict[Tuple[str, str], List[float]] = {}
+    for e in events:
+        durations.setdefault((e["cat"], e["name"]), []).append(e["dur"] / 1000)
+    table = Table(
+        "Category",
+        "Stage",
+        "Count",
+        "Total (ms)",
+        "p50 (ms)",
+        "p95 (ms)",
+        "Max (ms)",
+        title="Trace Summary",
+        box=box.ROUNDED,
+    )
+    for (category, name), values in sorted(
+        durations.items(), key=lambda item: -sum(item[1])
+    ):
+        if len(values) > 1:
+            quantiles = statistics.quantiles(values, n=100, method="inclusive")
+            p50, p95 = quantiles[49], quantiles[94]
+        else:
+            p50 = p95 = values[0]
+        table.add_row(
+            category,
+            name,
+            str(len(values)),
+            f"{sum(values):.1f}",
+            f"{p50:.1f}",
+            f"{p95:.1f}",
+            f"{max(values):.1f}",
         )
-        raise typer.Exit(1)
-    except requests.RequestException as e:
-        console.print(
-            f"[red]{ERROR_ICON}Error fetching tag for {github_repo}: {e}[/red]"
+    console.print(table)
+    console.print(f"[dim]{INFO_ICON}Wrote trace to {trace_file}[/dim]")
+
+
+def file_digest(path: Path) -> str:
+    """Returns the hex SHA-256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def find_font_file(font_pattern: str) -> Optional[Path]:
+    """Resolves a fontconfig pattern (e.g. "Iosevkata Nerd Font:bold") to a font file."""
+    try:
+        result = subprocess.run(
+            ["fc-match", "--format=%{file}", font_pattern],
+            capture_output=True,
+            text=True,
+            check=True,
         )
-        raise typer.Exit(1)
-    except KeyError:
-        console.print(
-            f"[red]{ERROR_ICON}Error: 'tag_name' not found in response for {github_repo}. Response: {response.text}[/red]"
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+    font_file = Path(result.stdout.strip())
+    return font_file if font_file.is_file() else None
+
+
+def get_font_digest(font_family: str) -> Optional[str]:
+    """Resolves the installed font file via fontconfig and returns its digest."""
+    font_file = find_font_file(font_family)
+    return file_digest(font_file) if font_file else None
+
+
+def render_cache_key(
+    source_digest: str,
+    theme_digest: str,
+    font_digest: str,
+    comment_key: str,
+    backend: Backend = Backend.SILICON,
+) -> str:
+    """Builds the cache key of a single preview from all of its render inputs."""
+    digest = hashlib.sha256()
+    for part in (
+        backend.value,
+        source_digest,
+        theme_digest,
+        font_digest,
+        json.dumps(SILICON_ARGS),
+        comment_key,
+    ):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def load_render_cache(cache_file: Path) -> Dict[str, Dict[str, str]]:
+    """Loads the render cache manifest, ignoring missing or stale manifests."""
+    try:
+        manifest = json.loads(cache_file.read_text())
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != RENDER_CACHE_VERSION:
+        return {}
+    return manifest.get("entries", {})
+
+
+def save_render_cache(cache_file: Path, entries: Dict[str, Dict[str, str]]):
+    """Atomically writes the render cache manifest."""
+    manifest = {
+        "version": RENDER_CACHE_VERSION,
+        "entries": dict(sorted(entries.items())),
+    }
+    write_json_atomic(cache_file, manifest)
+
+
+def is_render_cached(
+    entries: Dict[str, Dict[str, Any]],
+    output_file: Path,
+    key: str,
+    optimize: bool = False,
+) -> bool:
+    """
+    Checks whether an output is up-to-date with respect to its cache key.
+
+    With optimize, an output that was cached without being optimized is
+    out of date too.
+    """
+    entry = entries.get(output_file.name)
+    if entry is None or entry.get("key") != key or not output_file.is_file():
+        return False
+    if optimize and not entry.get("optimized"):
+        return False
+    return entry.get("output") == file_digest(output_file)
+
+
+@lru_cache(maxsize=None)
+def load_font(font_file: Path, size: int) -> Any:
+    """Loads a font face once per process and shares it across renders."""
+    from PIL import ImageFont
+
+    return ImageFont.truetype(str(font_file), size)
+
+
+# Codepoints kept in subsets of the preview font, set by enable_font_subsetting().
+_subset_codepoints: Optional[FrozenSet[int]] = None
+
+
+def enable_font_subsetting(codepoints: Optional[FrozenSet[int]]):
+    global _subset_codepoints
+    _subset_codepoints = codepoints
+
+
+@lru_cache(maxsize=None)
+def build_font_subset(font_file: Path, codepoints: FrozenSet[int]) -> Path:
+    """
+    Subsets a font to the given codepoints, keeping the layout features.
+
+    Subsets are built once per process and persisted under FONT_SUBSET_DIR by
+    the digest of the font and the codepoint set, so runs over unchanged
+    sources reuse them.
+    """
+    from fontTools import subset
+
+    key = hashlib.sha256(
+        f"{file_digest(font_file)}:{','.join(map(str, sorted(codepoints)))}".encode()
+    ).hexdigest()
+    subset_file = FONT_SUBSET_DIR / f"{key}{font_file.suffix}"
+    if subset_file.is_file():
+        return subset_file
+
+    with trace_span("subset font", "native", font=font_file.name):
+        options = subset.Options()
+        options.layout_features = ["*"]
+        options.name_IDs = ["*"]
+        # FontForge's timestamp table, left by the Nerd Font patcher
+        options.drop_tables += ["FFTM"]
+        font = subset.load_font(str(font_file), options)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(font)
+        FONT_SUBSET_DIR.mkdir(parents=True, exist_ok=True)
+        staged_file = subset_file.with_name(f".{subset_file.name}.{os.getpid()}.tmp")
+        subset.save_font(font, str(staged_file), options)
+        os.replace(staged_file, subset_file)
+    return subset_file
+
+
+def load_preview_font(bold: bool = False, italic: bool = False) -> Any:
+    """
+    Loads a style of the preview font, falling back to the regular face.
+
+    When subsetting is enabled, the face is loaded from a subset holding only
+    the codepoints of this run's sources and comment.
+    """
+    global _subset_codepoints
+
+    pattern = PREVIEW_FONT_FAMILY
+    if bold:
+        pattern += ":bold"
+    if italic:
+        pattern += ":italic"
+    font_file = find_font_file(pattern) or find_font_file(PREVIEW_FONT_FAMILY)
+    if font_file is None:
+        raise FileNotFoundError(f"{PREVIEW_FONT_FAMILY} not found by fc-match")
+    if _subset_codepoints is not None:
+        try:
+            font_file = build_font_subset(font_file, _subset_codepoints)
+        except Exception as e:
+            console.print(
+                f"[yellow]{WARNING_ICON}Could not subset {font_file.name}, using the full font: {e}[/yellow]"
+            )
+            _subset_codepoints = None
+    return load_font(font_file, PREVIEW_FONT_SIZE)
+
+
+def compile_tmtheme(theme_file: Path) -> Dict[str, Any]:
+    """
+    Compiles a tmTheme file into a compact style table.
+
+    Returns:
+        dict: The theme's background, foreground and gutter_foreground colors,
+              and "scopes", mapping each scope selector to
+              [foreground or None, bold, italic]. A later rule for the same
+              selector overrides an earlier one, as in TextMate.
+    """
+    with open(theme_file, "rb") as f:
+        theme = plistlib.load(f)
+    global_settings: Dict[str, str] = {}
+    scopes: Dict[str, List[Any]] = {}
+    for item in theme.get("settings", []):
+        settings = item.get("settings", {})
+        if "scope" not in item:
+            global_settings.update(settings)
+            continue
+        font_style = settings.get("fontStyle", "")
+        style = [
+            settings.get("foreground"),
+            "bold" in font_style,
+            "italic" in font_style,
+        ]
+        for selector in item["scope"].split(","):
+            selector = selector.strip()
+            # Descendant selectors need a scope stack, which flat Pygments tokens don't have
+            if selector and " " not in selector:
+                scopes[selector] = style
+    foreground = global_settings.get("foreground", "#000000")
+    return {
+        "version": THEME_CACHE_VERSION,
+        "background": global_settings.get("background", "#ffffff"),
+        "foreground": foreground,
+        "gutter_foreground": global_settings.get("gutterForeground", foreground),
+        "scopes": scopes,
+    }
+
+
+_themes: Dict[str, Dict[str, Any]] = {}
+_themes_lock = threading.Lock()
+
+
+def load_theme(theme_file: Path, digest: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Loads the compiled style table of a tmTheme file.
+
+    Tables are memoized in-process and persisted under THEME_CACHE_DIR by the
+    digest of the theme file, so each theme is parsed once across sources,
+    workers and runs.
+    """
+    digest = digest or file_digest(theme_file)
+    with _themes_lock:
+        theme = _themes.get(digest)
+        if theme is not None:
+            return theme
+
+        cache_file = THEME_CACHE_DIR / f"{digest}.json"
+        try:
+            theme = json.loads(cache_file.read_text())
+        except (OSError, ValueError):
+            theme = None
+        if theme is None or theme.get("version") != THEME_CACHE_VERSION:
+            theme = compile_tmtheme(theme_file)
+            try:
+                THEME_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                write_json_atomic(cache_file, theme, indent=None)
+            except OSError:
+                # The persistent cache is an optimization only
+                pass
+
+        _themes[digest] = theme
+        return theme
+
+
+def theme_scope_style(theme: Dict[str, Any], scope: str) -> Tuple[str, bool, bool]:
+    """Resolves a scope to (color, bold, italic) via its most specific selector."""
+    scopes = theme["scopes"]
+    parts = scope.split(".")
+    while parts:
+        style = scopes.get(".".join(parts))
+        if style is not None:
+            return (style[0] or theme["foreground"], style[1], style[2])
+        parts.pop()
+    return (theme["foreground"], False, False)
+
+
+def token_scope(token_type: Any) -> Optional[str]:
+    """Maps a Pygments token type to a TextMate scope."""
+    path = str(token_type).split(".")[1:]
+    while path:
+        scope = PYGMENTS_TOKEN_SCOPES.get(".".join(path))
+        if scope is not None:
+            return scope
+        path.pop()
+    return None
+
+
+# FreeType faces are not safe to rasterize from several threads at once.
+_native_font_lock = threading.Lock()
+
+
+def render_with_native(
+    text: str,
+    filename: str,
+    theme_file: Path,
+    output_file: Path,
+    line_offset: int = 1,
+) -> bool:
+    """Renders highlighted source into a PNG in-process with Pygments and Pillow."""
+    try:
+        from PIL import Image, ImageColor, ImageDraw
+        from pygments.lexers import get_lexer_for_filename
+        from pygments.util import ClassNotFound
+    except ImportError as e:
+        console.print(f"[red]Native backend requires Pillow and Pygments: {e}[/red]")
+        return False
+
+    try:
+        lexer = get_lexer_for_filename(
+            filename, stripnl=False, ensurenl=False, tabsize=NATIVE_TAB_WIDTH
         )
-        raise typer.Exit(1)
+    except ClassNotFound:
+        console.print(f"[red]No Pygments lexer for {filename}[/red]")
+        return False
+
+    with trace_span("load theme", "native", theme=theme_file.name):
+        theme = load_theme(theme_file)
+    foreground = theme["foreground"]
+    background = theme["background"]
+    gutter_foreground = theme["gutter_foreground"]
+
+    # Split the token stream into lines of (text, color, bold, italic) runs
+    styles: Dict[Any, Tuple[str, bool, bool]] = {}
+    lines: List[List[Tuple[str, str, bool, bool]]] = [[]]
+    with trace_span("tokenize", "native", source=filename):
+        for token_type, value in lexer.get_tokens(text):
+            if token_type not in styles:
+                scope = token_scope(token_type)
+                styles[token_type] = (
+                    theme_scope_style(theme, scope)
+                    if scope
+                    else (foreground, False, False)
+                )
+            color, bold, italic = styles[token_type]
+            for i, part in enumerate(value.split("\n")):
+                if i > 0:
+                    lines.append([])
+                if part:
+                    lines[-1].append((part, color, bold, italic))
+        if len(lines) > 1 and not lines[-1]:
+            lines.pop()
+
+    try:
+        with _native_font_lock, trace_span("paint", "native", output=output_file.name):
+            regular = load_preview_font()
+            ascent, descent = regular.getmetrics()
+            line_height = ascent + descent + NATIVE_LINE_PAD
+            gutter_width = (
+                regular.getlength("0" * len(str(line_offset + len(lines) - 1)))
+                + regular.getlength(" ")
+                + NATIVE_CODE_PAD
+            )
+            code_width = max(
+                (
+                    sum(
+                        load_preview_font(bold, italic).getlength(part)
+                        for part, _, bold, italic in line
+                    )
+                    for line in lines
+                ),
+                default=0,
+            )
+            width = int(gutter_width + code_width + 2 * NATIVE_CODE_PAD)
+            height = int(line_height * len(lines) + 2 * NATIVE_CODE_PAD)
+
+            image = Image.new("RGBA", (width, height), ImageColor.getrgb(background))
+            draw = ImageDraw.Draw(image)
+            for row, line in enumerate(lines):
+                number = line_offset + row
+                y = NATIVE_CODE_PAD + row * line_height
+                draw.text(
+                    (NATIVE_CODE_PAD + gutter_width - regular.getlength(" "), y),
+                    str(number),
+                    font=regular,
+                    fill=ImageColor.getrgb(gutter_foreground),
+                    anchor="ra",
+                )
+                x = NATIVE_CODE_PAD + gutter_width
+                for part, color, bold, italic in line:
+                    font = load_preview_font(bold, italic)
+                    draw.text((x, y), part, font=font, fill=ImageColor.getrgb(color))
+                    x += font.getlength(part)
+    except (OSError, ValueError) as e:
+        console.print(f"[red]Native render error: {e}[/red]")
+        return False
+
+    with trace_span("encode", "native", output=output_file.name):
+        image.save(output_file, format="PNG")
+    return True
+
 
+def preview_name(
+    source_file: Path, theme_file: Path, page: Optional[int] = None
+) -> str:
+    """Returns the file name of a preview: <stem>_<theme>.png or <stem>_<theme>_pN.png."""
+    suffix = f"_p{page}" if page is not None else ""
+    return f"{source_file.stem}_{theme_file.stem}{suffix}.png"
 
+
+def split_pages(
+    source_text: str, max_lines: Optional[int]
+) -> List[Tuple[Optional[int], int, str]]:
+    """
+    Splits a source into pages of at most max_lines lines.
+
+    Returns:
+        list: (page number, line offset, text) for each page. A source that
+              fits on one page is returned whole, with no page number. The
+              line offset is the line number of the page's first line, the
+              prepended comment. The renderers number every line, comments
+              included, so numbers count rendered lines: they run on across
+              pages without repeats, and source line n of page p is shown
+              as n + p.
+    """
+    lines = source_text.splitlines(keepends=True)
+    if max_lines is None or len(lines) <= max_lines:
+        return [(None, 1, source_text)]
+    return [
+        (page, start + page, "".join(lines[start : start + max_lines]))
+        for page, start in enumerate(range(0, len(lines), max_lines), start=1)
+    ]
+
+
+@trace_span("render", "render")
 def process_source_file(
-    source_file: Path, theme_file: Path, output_dir: Path, comment: str
+    source_file: Path,
+    theme_file: Path,
+    output_dir: Path,
+    source_text: str,
+    timeout: Optional[float] = DEFAULT_RENDER_TIMEOUT,
+    backend: Backend = Backend.SILICON,
+    page: Optional[int] = None,
+    line_offset: int = 1,
 ) -> bool:
-    """Process a single source file to generate preview image."""
+    """
+    Process a single source file to generate preview image.
+
+    source_text is the content of source_file (or of one of its pages) with
+    the comment prepended, built once per run and fed to the renderer in
+    memory. line_offset is the line number of its first line.
+    """
+
+    output_file = output_dir / preview_name(source_file, theme_file, page)
+
+    if backend == Backend.NATIVE:
+        return render_with_native(
+            source_text,
+            source_file.name,
+            theme_file,
+            output_file,
+            line_offset,
+        )
+
+    # Run silicon command, reading the source from stdin
+    cmd = [
+        "silicon",
+        "--language",
+        source_file.suffix.lstrip("."),
+        "--output",
+        str(output_file),
+        "--theme",
+        str(theme_file),
+        *SILICON_ARGS,
+    ]
+    if line_offset != 1:
+        cmd += ["--line-offset", str(line_offset)]
+
+    try:
+        with trace_span("silicon", "render", output=output_file.name):
+            result = subprocess.run(
+                cmd,
+                input=source_text,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+    except subprocess.TimeoutExpired:
+        console.print(
+            f"[red]Silicon timed out after {timeout}s: {output_file.name}[/red]"
+        )
+        return False
+    success = result.returncode == 0
+
+    if not success:
+        console.print(f"[red]Silicon error: {result.stderr}[/red]")
+
+    return success
+
 
-    output_file = output_dir / f"{source_file.stem}_{theme_file.stem}.png"
+@trace_span("optimize", "post")
+def optimize_png(png_file: Path) -> Tuple[int, int]:
+    """
+    Losslessly recompresses a PNG in place.
+
+    Drops the alpha channel when fully opaque, reduces to a palette when the
+    image has at most 256 colors, strips metadata and uses the strongest
+    deflate. The file is only replaced if the result is smaller.
+
+    Returns:
+        tuple: The file size in bytes before and after.
+    """
+    from PIL import Image
+
+    before = png_file.stat().st_size
+    with Image.open(png_file) as source:
+        image = source.convert("RGBA")
+
+    save_kwargs: Dict[str, Any] = {"format": "PNG", "optimize": True}
+    colors = image.getcolors(256)
+    opaque = image.getchannel("A").getextrema() == (255, 255)
+    if colors is not None:
+        # Exact palette, so no color is ever approximated
+        palette = [color for _, color in colors]
+        index = {
+            int.from_bytes(bytes(color), sys.byteorder): i
+            for i, color in enumerate(palette)
+        }
+        pixels = memoryview(image.tobytes()).cast("I")
+        optimized = Image.frombytes(
+            "P", image.size, bytes(index[pixel] for pixel in pixels)
+        )
+        optimized.putpalette([channel for color in palette for channel in color[:3]])
+        if not opaque:
+            save_kwargs["transparency"] = bytes(color[3] for color in palette)
+    elif opaque:
+        optimized = image.convert("RGB")
+    else:
+        optimized = image
 
-    # Create temporary file with same extension
     with tempfile.NamedTemporaryFile(
-        mode="w", suffix=source_file.suffix, delete=False
+        dir=png_file.parent, suffix=".png", delete=False
     ) as tmp_file:
-        # Write comment and original content
-        tmp_file.write(f"{comment}\n")
-        tmp_file.write(source_file.read_text())
-        tmp_file_path = tmp_file.name
+        optimized.save(tmp_file, **save_kwargs)
+    after = Path(tmp_file.name).stat().st_size
+    if after < before:
+        shutil.copymode(png_file, tmp_file.name)
+        os.replace(tmp_file.name, png_file)
+        return before, after
+    Path(tmp_file.name).unlink()
+    return before, before
+
+
+def first_line_band(image: Any) -> int:
+    """
+    Finds where the first line of text ends in a rendered preview.
+
+    Scans rows from the top for the first run of rows containing anything but
+    the background color, and returns the row index right after it.
+    """
+    rgba = image.convert("RGBA")
+    background = rgba.getpixel((0, 0))
+    width, height = rgba.size
+    ink_seen = False
+    for y in range(height):
+        colors = rgba.crop((0, y, width, y + 1)).getcolors(1)
+        if colors is None or colors[0][1] != background:
+            ink_seen = True
+        elif ink_seen:
+            return y
+    return height
 
+
+@trace_span("compare", "post")
+def is_preview_unchanged(new_file: Path, old_file: Path, tolerance: int) -> bool:
+    """
+    Compares two previews pixel by pixel, ignoring the first line.
+
+    The first line holds the generated comment, whose timestamp changes on
+    every run. Callers must make sure the rest of the comment is the same.
+    Any other pixel differing by more than tolerance in some
+    channel counts as a change.
+    """
+    from PIL import Image, ImageChops, ImageDraw
+
+    with Image.open(new_file) as new, Image.open(old_file) as old:
+        if new.size != old.size:
+            return False
+        new_rgba = new.convert("RGBA")
+        old_rgba = old.convert("RGBA")
+    diff = ImageChops.difference(new_rgba, old_rgba)
+    mask_end = max(first_line_band(new_rgba), first_line_band(old_rgba))
+    ImageDraw.Draw(diff).rectangle((0, 0, diff.width, mask_end), fill=(0, 0, 0, 0))
+    return all(high <= tolerance for _, high in diff.getextrema())
+
+
+def png_width(png_file: Path) -> Optional[int]:
+    """Reads the width of a PNG from its IHDR chunk, or None if it can't be read."""
     try:
-        # Run silicon command
-        cmd = [
-            "silicon",
-            tmp_file_path,
-            "--output",
-            str(output_file),
-            "--theme",
-            str(theme_file),
-            "--pad-horiz",
-            "0",
-            "--pad-vert",
-            "0",
-            "--background",
-            "#fff0",
-            "--font",
-            "Iosevkata Nerd Font=48",
-            "--no-window-controls",
-            "--no-round-corner",
-        ]
+        with open(png_file, "rb") as f:
+            header = f.read(24)
+    except OSError:
+        return None
+    if len(header) < 24 or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">I", header[16:20])[0]
+
+
+def derivative_files(
+    png_file: Path, formats: List[str], sizes: List[int]
+) -> List[Path]:
+    """
+    Lists the derivatives of a preview: <name>.<format> and <name>_<width>w.<format>.
 
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        success = result.returncode == 0
+    Like write_derivatives, widths at or above the preview's own are left
+    out, as they're never upscaled.
+    """
+    files = [png_file.with_suffix(f".{fmt}") for fmt in formats if fmt != "png"]
+    image_width = png_width(png_file)
+    for width in sizes:
+        if image_width is not None and width >= image_width:
+            continue
+        files.extend(
+            png_file.with_name(f"{png_file.stem}_{width}w.{fmt}") for fmt in formats
+        )
+    return files
+
+
+@trace_span("derive", "post")
+def write_derivatives(
+    png_file: Path, formats: List[str], sizes: List[int]
+) -> List[Tuple[Path, int]]:
+    """
+    Encodes a preview into every requested format and thumbnail width.
+
+    The PNG is decoded once; each size is resampled once and then encoded
+    into every format. Thumbnails are never upscaled.
+
+    Returns:
+        list: (file, size in bytes) of every written derivative.
+    """
+    from PIL import Image
 
-        if not success:
-            console.print(f"[red]Silicon error: {result.stderr}[/red]")
+    with Image.open(png_file) as source:
+        image = source.convert("RGBA")
 
-        return success
+    written = []
+    variants = [(None, image)] + [
+        (
+            width,
+            image.resize(
+                (width, max(1, round(image.height * width / image.width))),
+                Image.Resampling.LANCZOS,
+            ),
+        )
+        for width in sizes
+        if width < image.width
+    ]
+    for width, variant in variants:
+        for fmt in formats:
+            if width is None and fmt == "png":
+                continue
+            if width is None:
+                target = png_file.with_suffix(f".{fmt}")
+            else:
+                target = png_file.with_name(f"{png_file.stem}_{width}w.{fmt}")
+            save_kwargs: Dict[str, Any] = DERIVATIVE_SAVE_OPTIONS[fmt]
+            variant.save(target, **save_kwargs)
+            written.append((target, target.stat().st_size))
+    return written
+
+
+def png_chunk(tag: bytes, data: bytes) -> bytes:
+    """Encodes a single PNG chunk."""
+    return (
+        struct.pack(">I", len(data))
+        + tag
+        + data
+        + struct.pack(">I", zlib.crc32(tag + data))
+    )
+
+
+@trace_span("contact sheet", "post")
+def build_contact_sheet(
+    tiles: List[Tuple[str, Path]], sheet_file: Path, columns: int, tile_width: int
+) -> Tuple[int, int]:
+    """
+    Tiles labelled previews into a grid, streaming one row of tiles at a time.
+
+    The PNG is encoded by hand so each row strip can be deflated and written
+    as soon as it's painted: only one decoded tile and one strip are held in
+    memory, no matter how many tiles the sheet has.
+
+    Returns:
+        tuple: The width and height of the sheet.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    # Lay out rows from the image headers alone, without decoding any pixels
+    rows = [tiles[i : i + columns] for i in range(0, len(tiles), columns)]
+    row_heights = []
+    for row in rows:
+        tallest = 0
+        for _, tile_file in row:
+            with Image.open(tile_file) as tile:
+                tallest = max(tallest, round(tile.height * tile_width / tile.width))
+        row_heights.append(CONTACT_SHEET_LABEL_HEIGHT + tallest + CONTACT_SHEET_GAP)
+    width = columns * tile_width + (columns + 1) * CONTACT_SHEET_GAP
+    height = CONTACT_SHEET_GAP + sum(row_heights)
+
+    label_font = ImageFont.load_default(size=CONTACT_SHEET_LABEL_HEIGHT * 3 // 4)
+    compressor = zlib.compressobj(9)
+    with tempfile.NamedTemporaryFile(
+        dir=sheet_file.parent, suffix=".png", delete=False
+    ) as sheet:
+        sheet.write(b"\x89PNG\r\n\x1a\n")
+        # 8-bit RGBA, no interlacing
+        sheet.write(
+            png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        )
+
+        def write_rows(image: Any):
+            stride = image.width * 4
+            raw = image.tobytes()
+            for y in range(image.height):
+                # Filter type 0 (none) for every scanline
+                data = compressor.compress(b"\x00" + raw[y * stride : (y + 1) * stride])
+                if data:
+                    sheet.write(png_chunk(b"IDAT", data))
+
+        write_rows(Image.new("RGBA", (width, CONTACT_SHEET_GAP)))
+        for row, row_height in zip(rows, row_heights):
+            strip = Image.new("RGBA", (width, row_height))
+            draw = ImageDraw.Draw(strip)
+            for column, (label, tile_file) in enumerate(row):
+                x = CONTACT_SHEET_GAP + column * (tile_width + CONTACT_SHEET_GAP)
+                draw.text(
+                    (x, 0), label, font=label_font, fill=CONTACT_SHEET_LABEL_COLOR
+                )
+                with Image.open(tile_file) as tile:
+                    scaled = tile.convert("RGBA").resize(
+                        (tile_width, round(tile.height * tile_width / tile.width)),
+                        Image.Resampling.LANCZOS,
+                    )
+                strip.paste(scaled, (x, CONTACT_SHEET_LABEL_HEIGHT))
+                del scaled
+            write_rows(strip)
+            del strip, draw
+        sheet.write(png_chunk(b"IDAT", compressor.flush()))
+        sheet.write(png_chunk(b"IEND", b""))
+    os.replace(sheet.name, sheet_file)
+    return width, height
+
+
+def font_codepoints(font_file: Path) -> List[int]:
+    """Returns every codepoint mapped by the font's cmap, in order."""
+    from fontTools.ttLib import TTFont
+
+    with TTFont(font_file, lazy=True) as font:
+        return sorted(font.getBestCmap())
+
+
+@trace_span("specimen", "post")
+def build_specimen(
+    font_file: Path, specimen_file: Path, columns: int = SPECIMEN_COLUMNS
+) -> Tuple[int, int, int]:
+    """
+    Renders a grid of every glyph the font maps, Nerd Font symbols included.
+
+    The sheet is a single grayscale array. Glyphs are rasterized with one
+    cached face into a coverage strip of SPECIMEN_BATCH_ROWS rows at a time,
+    and each strip is composited into the array in one vectorized operation,
+    instead of pasting glyph images one by one.
+
+    Returns:
+        tuple: The number of glyphs, and the width and height of the sheet.
+    """
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+
+    codepoints = font_codepoints(font_file)
+    font = load_font(font_file, SPECIMEN_FONT_SIZE)
+    label_font = ImageFont.load_default(size=SPECIMEN_FONT_SIZE // 2)
+    ascent, descent = font.getmetrics()
+    # Two advances leave room for the double-width Nerd Font symbols
+    cell_width = round(font.getlength("0") * 2) + 2 * SPECIMEN_PAD
+    cell_height = ascent + descent + 2 * SPECIMEN_PAD
+    header_height = cell_height
+
+    rows = -(-len(codepoints) // columns)
+    width = SPECIMEN_LABEL_WIDTH + columns * cell_width + 1
+    height = header_height + rows * cell_height + 1
+    canvas = np.full((height, width), 255, dtype=np.uint8)
+
+    header = Image.new("L", (width, header_height))
+    ImageDraw.Draw(header).text(
+        (SPECIMEN_PAD, header_height // 2),
+        f"{font_file.name}: {len(codepoints)} glyphs",
+        font=label_font,
+        fill=255,
+        anchor="lm",
+    )
+    canvas[:header_height] -= np.asarray(header)
+
+    for first_row in range(0, rows, SPECIMEN_BATCH_ROWS):
+        batch_rows = min(SPECIMEN_BATCH_ROWS, rows - first_row)
+        batch = codepoints[first_row * columns : (first_row + batch_rows) * columns]
+        strip = Image.new("L", (width, batch_rows * cell_height))
+        draw = ImageDraw.Draw(strip)
+        for index, codepoint in enumerate(batch):
+            row, column = divmod(index, columns)
+            if column == 0:
+                draw.text(
+                    (SPECIMEN_PAD, row * cell_height + cell_height // 2),
+                    f"U+{codepoint:04X}",
+                    font=label_font,
+                    fill=SPECIMEN_LABEL_LEVEL,
+                    anchor="lm",
+                )
+            draw.text(
+                (
+                    SPECIMEN_LABEL_WIDTH + column * cell_width + cell_width // 2,
+                    row * cell_height + SPECIMEN_PAD + ascent,
+                ),
+                chr(codepoint),
+                font=font,
+                fill=255,
+                anchor="ms",
+            )
+        top = header_height + first_row * cell_height
+        canvas[top : top + strip.height] -= np.asarray(strip)
+        del strip, draw
 
+    # Grid lines, darkening only the blank pixels they cross
+    grid = np.minimum(canvas[header_height:], SPECIMEN_GRID_LEVEL)
+    canvas[header_height::cell_height, SPECIMEN_LABEL_WIDTH:] = grid[
+        ::cell_height, SPECIMEN_LABEL_WIDTH:
+    ]
+    canvas[header_height:, SPECIMEN_LABEL_WIDTH::cell_width] = grid[
+        :, SPECIMEN_LABEL_WIDTH::cell_width
+    ]
+
+    staged_file = specimen_file.with_name(f".{specimen_file.name}.tmp")
+    Image.fromarray(canvas).save(staged_file, format="PNG", optimize=True)
+    os.replace(staged_file, specimen_file)
+    return len(codepoints), width, height
+
+
+def render_specimens(font_dir: Path, output_dir: Path, jobs: int) -> int:
+    """
+    Renders a specimen of every font in the SPECIMEN_FONT_DIRS of a build.
+
+    Returns:
+        int: The number of fonts that failed to render.
+    """
+    font_files = [
+        f
+        for subdir in SPECIMEN_FONT_DIRS
+        if (font_dir / subdir).is_dir()
+        for f in sorted((font_dir / subdir).iterdir())
+        if f.suffix.lower() in (".ttf", ".otf")
+    ]
+    if not font_files:
+        console.print(f"[red]{ERROR_ICON}No fonts found in {font_dir}[/red]")
+        return 1
+
+    specimen_dir = output_dir / "specimens"
+    specimen_dir.mkdir(parents=True, exist_ok=True)
+    failed = 0
+    from rich.progress import (
+        BarColumn,
+        MofNCompleteColumn,
+        Progress,
+        SpinnerColumn,
+        TextColumn,
+    )
+
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        console=console,
+    ) as progress, ThreadPoolExecutor(max_workers=jobs) as executor:
+        task = progress.add_task("Rendering specimens...", total=len(font_files))
+        futures = {
+            executor.submit(
+                build_specimen, font_file, specimen_dir / f"{font_file.stem}.png"
+            ): font_file
+            for font_file in font_files
+        }
+        for future in as_completed(futures):
+            font_file = futures[future]
+            try:
+                glyphs, width, height = future.result()
+                console.print(
+                    f"[green]{SUCCESS_ICON}{font_file.stem}.png: {glyphs} glyphs, {width}x{height}[/green]"
+                )
+            except Exception as e:
+                console.print(f"[red]{ERROR_ICON}{font_file.name}: {e}[/red]")
+                failed += 1
+            progress.advance(task)
+    return failed
+
+
+def watch_directories(directories: List[Path], debounce: float) -> Iterator[Set[Path]]:
+    """
+    Yields the set of files changed in directories, once per burst of edits.
+
+    Events are collected until no new one arrives for debounce seconds. Uses
+    inotify on Linux and falls back to polling modification times elsewhere.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        inotify_fd = libc.inotify_init1(os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        inotify_fd = -1
+
+    if inotify_fd < 0:
+        yield from poll_directories(directories, debounce)
+        return
+
+    try:
+        watches = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(
+                inotify_fd,
+                os.fsencode(directory),
+                IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE,
+            )
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+            watches[wd] = directory
+
+        while True:
+            changed: Set[Path] = set()
+            timeout = None  # Block until the first event of a burst
+            while select.select([inotify_fd], [], [], timeout)[0]:
+                buffer = os.read(inotify_fd, 64 * 1024)
+                offset = 0
+                while offset < len(buffer):
+                    wd, _, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(
+                        buffer, offset
+                    )
+                    offset += INOTIFY_EVENT_HEADER.size
+                    name = buffer[offset : offset + name_length].rstrip(b"\0")
+                    offset += name_length
+                    if name and wd in watches:
+                        changed.add(watches[wd] / os.fsdecode(name))
+                timeout = debounce
+            changed = {f for f in changed if f.is_file()}
+            if changed:
+                yield changed
     finally:
-        # Clean up temp file
-        Path(tmp_file_path).unlink(missing_ok=True)
+        os.close(inotify_fd)
+
+
+def poll_directories(
+    directories: List[Path], debounce: float, interval: float = 0.5
+) -> Iterator[Set[Path]]:
+    """Polling fallback of watch_directories(), comparing modification times."""
+
+    def snapshot() -> Dict[Path, int]:
+        return {
+            f: f.stat().st_mtime_ns
+            for directory in directories
+            for f in directory.iterdir()
+            if f.is_file()
+        }
+
+    previous = snapshot()
+    while True:
+        time.sleep(interval)
+        current = snapshot()
+        if current == previous:
+            continue
+        # Wait for the burst of edits to settle
+        while True:
+            time.sleep(debounce)
+            settled = snapshot()
+            if settled == current:
+                break
+            current = settled
+        changed = {f for f, mtime in current.items() if previous.get(f) != mtime}
+        previous = current
+        if changed:
+            yield changed
 
 
 @app.command()
@@ -124,14 +1238,123 @@ def main(
         "--comment-string",
         help="Comment string for the generated comment line",
     ),
+    jobs: int = typer.Option(
+        os.cpu_count() or 1,
+        "--jobs",
+        "-j",
+        min=1,
+        help="Number of previews to render concurrently",
+    ),
+    timeout: float = typer.Option(
+        DEFAULT_RENDER_TIMEOUT,
+        "--timeout",
+        min=1,
+        help="Per-render timeout in seconds for a single silicon invocation",
+    ),
+    force: bool = typer.Option(
+        False,
+        "--force",
+        help="Ignore the render cache and re-render every preview",
+    ),
+    backend: Backend = typer.Option(
+        Backend.SILICON,
+        "--backend",
+        help="Renderer: spawn silicon per preview, or render in-process with Pillow and Pygments",
+    ),
+    optimize: bool = typer.Option(
+        False,
+        "--optimize",
+        help="Losslessly recompress rendered PNGs (palette reduction, metadata stripping, max deflate)",
+    ),
+    keep_unchanged: bool = typer.Option(
+        False,
+        "--keep-unchanged",
+        help="Keep an existing preview if its pixels only differ in the timestamp line",
+    ),
+    tolerance: int = typer.Option(
+        0,
+        "--tolerance",
+        min=0,
+        max=255,
+        help="Largest per-channel pixel difference still considered unchanged",
+    ),
+    formats: str = typer.Option(
+        "png",
+        "--formats",
+        help="Comma-separated formats to emit for each preview (png, webp, avif)",
+    ),
+    sizes: str = typer.Option(
+        "",
+        "--sizes",
+        help="Comma-separated thumbnail widths in pixels (e.g. 1200,600), emitted in every format",
+    ),
+    contact_sheet: bool = typer.Option(
+        False,
+        "--contact-sheet",
+        help="Also tile every theme's preview of a source into <source>_contact_sheet.png",
+    ),
+    contact_sheet_columns: int = typer.Option(
+        4,
+        "--contact-sheet-columns",
+        min=1,
+        help="Number of tiles per contact sheet row",
+    ),
+    contact_sheet_tile_width: int = typer.Option(
+        1000,
+        "--contact-sheet-tile-width",
+        min=1,
+        help="Width in pixels each preview is scaled to on the contact sheet",
+    ),
+    trace: Optional[str] = typer.Option(
+        None,
+        "--trace",
+        help="Record per-stage timings and write them as Chrome trace-event JSON to this file",
+    ),
+    max_lines: Optional[int] = typer.Option(
+        None,
+        "--max-lines",
+        min=1,
+        help="Split sources longer than this many lines into pages, rendered as <stem>_<theme>_pN.png",
+    ),
+    specimen: Optional[str] = typer.Option(
+        None,
+        "--specimen",
+        help="Render a glyph specimen of every font in this build directory (e.g. ./dist/Iosevkata) into <output>/specimens instead of previews",
+    ),
+    subset: bool = typer.Option(
+        True,
+        "--subset/--no-subset",
+        help="Render natively against a subset of the font holding only the codepoints in use",
+    ),
+    watch: bool = typer.Option(
+        False,
+        "--watch",
+        help="Keep running and re-render the previews affected by source or theme changes",
+    ),
+    debounce: float = typer.Option(
+        0.3,
+        "--debounce",
+        min=0,
+        help="Seconds without further changes before a burst of edits is re-rendered",
+    ),
 ):
     """Generate preview images from source files using Silicon."""
 
+    if trace:
+        enable_tracing()
+
     # Validate paths
     source_path = Path(source)
     output_path = Path(output)
     theme_path = Path(theme)
 
+    # Specimens are rendered from a font build alone, without sources or themes
+    if specimen is not None:
+        failed = render_specimens(Path(specimen), output_path, jobs)
+        if trace:
+            write_trace(Path(trace))
+        raise typer.Exit(1 if failed else 0)
+
     if not source_path.exists():
         console.print(
             f"[red]{ERROR_ICON}Source directory not found: {source_path}[/red]"
@@ -144,93 +1367,476 @@ def main(
         )
         raise typer.Exit(1)
 
+    # Parse derivative formats and sizes
+    format_list = [f.strip().lower() for f in formats.split(",") if f.strip()]
+    unknown_formats = set(format_list) - set(DERIVATIVE_SAVE_OPTIONS)
+    if unknown_formats:
+        console.print(
+            f"[red]{ERROR_ICON}Unsupported formats: {', '.join(sorted(unknown_formats))}[/red]"
+        )
+        raise typer.Exit(1)
+    if "avif" in format_list:
+        from PIL import features
+
+        if not features.check("avif"):
+            console.print(
+                f"[yellow]{WARNING_ICON}AVIF isn't supported by the installed Pillow, skipping it[/yellow]"
+            )
+            format_list.remove("avif")
+    try:
+        size_list = sorted(
+            {int(s) for s in sizes.split(",") if s.strip()}, reverse=True
+        )
+    except ValueError:
+        console.print(f"[red]{ERROR_ICON}Invalid thumbnail sizes: {sizes}[/red]")
+        raise typer.Exit(1)
+    emit_derivatives = bool(size_list) or format_list != ["png"]
+
     if version is None:
-        version = get_latest_github_release("ningw42/Iosevkata")
+        with trace_span("resolve version", "setup"):
+            version = get_latest_github_release("ningw42/Iosevkata", console)
 
     # Create output directory
     output_path.mkdir(parents=True, exist_ok=True)
 
-    # Generate timestamp
-    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+    def run_once(affected: Optional[Set[Path]] = None):
+        """Renders the matrix, or only the pairs involving an affected file."""
 
-    # Assemble the comment to prepend
-    comment = (
-        f"{comment_string} Generated at {timestamp} with Iosevkata Nerd Font v{version}"
-    )
+        # Generate timestamp
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
-    # Display info
-    info_text = Text()
-    info_text.append("Source: ", style="bold")
-    info_text.append(f"{source_path}\n")
-    info_text.append("Output: ", style="bold")
-    info_text.append(f"{output_path}\n")
-    info_text.append("Theme: ", style="bold")
-    info_text.append(f"{theme_path}\n")
-    info_text.append("Version: ", style="bold")
-    info_text.append(f"{version}\n")
-    info_text.append("Comment: ", style="bold")
-    info_text.append(f"{comment}")
-
-    console.print(Panel(info_text, title="Configuration", border_style="green"))
-
-    # Get source files
-    source_files = [f for f in source_path.iterdir() if f.is_file()]
-    theme_files = [f for f in theme_path.iterdir() if f.is_file()]
-
-    if not source_files:
-        console.print(
-            f"[yellow]{WARNING_ICON}No source file found in {source_path}[/yellow]"
-        )
-        return
+        # Assemble the comment to prepend
+        comment = f"{comment_string} Generated at {timestamp} with Iosevkata Nerd Font v{version}"
+        # The timestamp changes on every run, so it's left out of the cache key
+        comment_key = comment.replace(timestamp, "")
 
-    if not theme_files:
-        console.print(
-            f"[yellow]{WARNING_ICON}No theme file found in {theme_path}[/yellow]"
-        )
-        return
+        # Display info
+        info_text = Text()
+        info_text.append("Source: ", style="bold")
+        info_text.append(f"{source_path}\n")
+        info_text.append("Output: ", style="bold")
+        info_text.append(f"{output_path}\n")
+        info_text.append("Theme: ", style="bold")
+        info_text.append(f"{theme_path}\n")
+        info_text.append("Version: ", style="bold")
+        info_text.append(f"{version}\n")
+        info_text.append("Comment: ", style="bold")
+        info_text.append(f"{comment}\n")
+        info_text.append("Jobs: ", style="bold")
+        info_text.append(f"{jobs}\n")
+        info_text.append("Backend: ", style="bold")
+        info_text.append(f"{backend.value}")
 
-    # Process files with progress bar
-    successful = 0
-    failed = 0
+        if affected is None:
+            with trace_span("console", "output"):
+                console.print(
+                    Panel(info_text, title="Configuration", border_style="green")
+                )
 
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        console=console,
-    ) as progress:
+        # Get source files
+        source_files = [f for f in source_path.iterdir() if f.is_file()]
+        theme_files = [f for f in theme_path.iterdir() if f.is_file()]
+
+        if not source_files:
+            console.print(
+                f"[yellow]{WARNING_ICON}No source file found in {source_path}[/yellow]"
+            )
+            return
 
-        for source_file in source_files:
-            for theme_file in theme_files:
-                task = progress.add_task(
-                    f"Processing {source_file.name}...", total=None
+        if not theme_files:
+            console.print(
+                f"[yellow]{WARNING_ICON}No theme file found in {theme_path}[/yellow]"
+            )
+            return
+
+        # Look up cached renders, keyed by the digests of all render inputs
+        with trace_span("hash inputs", "setup"):
+            cache_file = output_path / RENDER_CACHE_FILENAME
+            cache_entries = load_render_cache(cache_file)
+            font_digest = get_font_digest(PREVIEW_FONT_FAMILY)
+            if font_digest is None:
+                console.print(
+                    f"[yellow]{WARNING_ICON}Could not locate {PREVIEW_FONT_FAMILY} with fc-match, render cache disabled[/yellow]"
                 )
+            # Read every source once, and prepend the comment once per source
+            source_bytes = {f: f.read_bytes() for f in source_files}
+            source_digests = {
+                f: hashlib.sha256(b).hexdigest() for f, b in source_bytes.items()
+            }
+            source_pages = {
+                f: [
+                    (page, offset, f"{comment}\n{text}")
+                    for page, offset, text in split_pages(b.decode(), max_lines)
+                ]
+                for f, b in source_bytes.items()
+            }
+            if backend == Backend.NATIVE and subset:
+                # Gutter digits are drawn besides the sources and the comment
+                used = set(comment + "0123456789 ")
+                for b in source_bytes.values():
+                    used.update(b.decode())
+                enable_font_subsetting(frozenset(map(ord, used)))
+            theme_digests = {f: file_digest(f) for f in theme_files}
+
+        with trace_span("cache lookup", "setup"):
+            pairs = []
+            cache_keys = {}
+            cached = 0
+            for source_file in source_files:
+                for theme_file in theme_files:
+                    if (
+                        affected is not None
+                        and source_file not in affected
+                        and theme_file not in affected
+                    ):
+                        continue
+                    for page_index, (page, line_offset, _) in enumerate(
+                        source_pages[source_file]
+                    ):
+                        output_file = output_path / preview_name(
+                            source_file, theme_file, page
+                        )
+                        if font_digest is not None:
+                            key = render_cache_key(
+                                f"{source_digests[source_file]}:{max_lines}:{page}:{line_offset}",
+                                theme_digests[theme_file],
+                                font_digest,
+                                comment_key,
+                                backend,
+                            )
+                            cache_keys[output_file] = key
+                            if (
+                                not force
+                                and is_render_cached(
+                                    cache_entries, output_file, key, optimize
+                                )
+                                and all(
+                                    f.is_file()
+                                    for f in derivative_files(
+                                        output_file, format_list, size_list
+                                    )
+                                )
+                            ):
+                                cached += 1
+                                continue
+                        pairs.append((source_file, theme_file, page_index))
+
+        if cached:
+            console.print(
+                f"[dim]{INFO_ICON}Skipping {cached} unchanged previews (use --force to re-render)[/dim]"
+            )
+
+        # Process every remaining source/theme pair on a bounded worker pool.
+        # Follow-up stages of a finished render (comparison against the existing
+        # preview, optimization) are queued on the same pool, so they overlap with
+        # the renders still in flight.
+        successful = 0
+        unchanged = 0
+        failed = 0
+        bytes_before = 0
+        bytes_after = 0
+        optimize_total = 0
+
+        def record_cache_entry(output_file: Path, optimized: bool):
+            if output_file in cache_keys:
+                cache_entries[output_file.name] = {
+                    "key": cache_keys[output_file],
+                    "output": file_digest(output_file),
+                    "comment": comment_key,
+                    "optimized": optimized,
+                }
+
+        def record_success(output_file: Path, optimized: bool):
+            nonlocal successful
+            console.print(f"[green]{SUCCESS_ICON}Success[/green]")
+            successful += 1
+            record_cache_entry(output_file, optimized)
+
+        from rich.progress import (
+            BarColumn,
+            MofNCompleteColumn,
+            Progress,
+            SpinnerColumn,
+            TextColumn,
+        )
+
+        with trace_span("render matrix", "setup"), Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            MofNCompleteColumn(),
+            console=console,
+        ) as progress, tempfile.TemporaryDirectory(
+            dir=output_path, prefix=".staging-"
+        ) as staging_dir:
+            task = progress.add_task("Rendering previews...", total=len(pairs))
+            optimize_task = (
+                progress.add_task("Optimizing PNGs...", total=0) if optimize else None
+            )
+            # With --keep-unchanged, renders land in a staging directory first and
+            # only replace an existing preview if it actually changed.
+            render_path = Path(staging_dir) if keep_unchanged else output_path
+
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                pending: Dict[Future, Tuple[str, Path, Path, Optional[int]]] = {}
+                for source_file, theme_file, page_index in pairs:
+                    page, line_offset, page_text = source_pages[source_file][page_index]
+                    render_future = executor.submit(
+                        process_source_file,
+                        source_file,
+                        theme_file,
+                        render_path,
+                        page_text,
+                        timeout,
+                        backend,
+                        page,
+                        line_offset,
+                    )
+                    pending[render_future] = ("render", source_file, theme_file, page)
 
-                console.print(f"\n[bold]Processing:[/bold] {source_file.name}")
-                output_file = output_path / f"{source_file.stem}.png"
-                console.print(f"  [dim]Output:[/dim] {output_file}")
-                console.print(f"  [dim]Adding comment:[/dim] {comment}")
+                def derive(
+                    source_file: Path,
+                    theme_file: Path,
+                    page: Optional[int],
+                    output_file: Path,
+                ):
+                    if emit_derivatives:
+                        derive_future = executor.submit(
+                            write_derivatives, output_file, format_list, size_list
+                        )
+                        pending[derive_future] = (
+                            "derive",
+                            source_file,
+                            theme_file,
+                            page,
+                        )
 
-                success = process_source_file(
-                    source_file, theme_file, output_path, comment
+                def finish(
+                    source_file: Path,
+                    theme_file: Path,
+                    page: Optional[int],
+                    output_file: Path,
+                ):
+                    nonlocal optimize_total
+                    if optimize:
+                        optimize_future = executor.submit(optimize_png, output_file)
+                        pending[optimize_future] = (
+                            "optimize",
+                            source_file,
+                            theme_file,
+                            page,
+                        )
+                        optimize_total += 1
+                        progress.update(optimize_task, total=optimize_total)
+                    else:
+                        record_success(output_file, optimized=False)
+                        derive(source_file, theme_file, page, output_file)
+
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage, source_file, theme_file, page = pending.pop(future)
+                        output_name = preview_name(source_file, theme_file, page)
+                        output_file = output_path / output_name
+                        staged_file = render_path / output_name
+
+                        if stage == "optimize":
+                            try:
+                                before, after = future.result()
+                            except Exception as e:
+                                console.print(
+                                    f"[yellow]{WARNING_ICON}Could not optimize {output_file.name}: {e}[/yellow]"
+                                )
+                                optimized = False
+                            else:
+                                bytes_before += before
+                                bytes_after += after
+                                console.print(
+                                    f"  [dim]Optimized:[/dim] {output_file.name} {before:,} -> {after:,} bytes ({before - after:,} saved)"
+                                )
+                                optimized = True
+                            record_success(output_file, optimized)
+                            derive(source_file, theme_file, page, output_file)
+                            progress.advance(optimize_task)
+                            continue
+
+                        if stage == "derive":
+                            try:
+                                written = future.result()
+                            except Exception as e:
+                                console.print(
+                                    f"[yellow]{WARNING_ICON}Could not write derivatives of {output_file.name}: {e}[/yellow]"
+                                )
+                            else:
+                                for derived_file, size in written:
+                                    console.print(
+                                        f"  [dim]Derived:[/dim] {derived_file.name} ({size:,} bytes)"
+                                    )
+                            continue
+
+                        if stage == "compare":
+                            try:
+                                same = future.result()
+                            except Exception as e:
+                                console.print(
+                                    f"[yellow]{WARNING_ICON}Could not compare {output_file.name}: {e}[/yellow]"
+                                )
+                                same = False
+                            if same:
+                                staged_file.unlink()
+                                console.print(
+                                    f"  [dim]Unchanged:[/dim] kept existing {output_file.name}"
+                                )
+                                # The kept file is only known to be optimized
+                                # if its previous entry still describes it
+                                previous = cache_entries.get(output_file.name, {})
+                                optimized = bool(
+                                    previous.get("optimized")
+                                    and previous.get("output")
+                                    == file_digest(output_file)
+                                )
+                                if optimize and not optimized:
+                                    finish(source_file, theme_file, page, output_file)
+                                    continue
+                                unchanged += 1
+                                record_cache_entry(output_file, optimized)
+                                if not all(
+                                    f.is_file()
+                                    for f in derivative_files(
+                                        output_file, format_list, size_list
+                                    )
+                                ):
+                                    derive(source_file, theme_file, page, output_file)
+                            else:
+                                os.replace(staged_file, output_file)
+                                finish(source_file, theme_file, page, output_file)
+                            continue
+
+                        try:
+                            success = future.result()
+                        except Exception as e:
+                            console.print(
+                                f"[red]{ERROR_ICON}Unexpected error: {e}[/red]"
+                            )
+                            success = False
+
+                        with trace_span("console", "output"):
+                            console.print(
+                                f"\n[bold]Processed:[/bold] {source_file.name}{f' (page {page})' if page else ''} with {theme_file.name}"
+                            )
+                            console.print(f"  [dim]Output:[/dim] {output_file}")
+
+                        if not success:
+                            console.print(f"[red]{ERROR_ICON}Failed[/red]")
+                            failed += 1
+                        elif (
+                            keep_unchanged
+                            and output_file.is_file()
+                            # The masked line must only differ by its timestamp
+                            and cache_entries.get(output_name, {}).get("comment")
+                            == comment_key
+                        ):
+                            compare_future = executor.submit(
+                                is_preview_unchanged,
+                                staged_file,
+                                output_file,
+                                tolerance,
+                            )
+                            pending[compare_future] = (
+                                "compare",
+                                source_file,
+                                theme_file,
+                                page,
+                            )
+                        else:
+                            if staged_file != output_file:
+                                os.replace(staged_file, output_file)
+                            finish(source_file, theme_file, page, output_file)
+
+                        progress.advance(task)
+
+        if cache_keys:
+            save_render_cache(cache_file, cache_entries)
+
+        if optimize and bytes_before:
+            console.print(
+                f"\n[dim]{INFO_ICON}Optimized PNGs: {bytes_before:,} -> {bytes_after:,} bytes ({bytes_before - bytes_after:,} saved, {100 * (bytes_before - bytes_after) / bytes_before:.1f}%)[/dim]"
+            )
+
+        if contact_sheet:
+            for source_file in source_files:
+                # Paged sources are represented by their first page
+                first_page = source_pages[source_file][0][0]
+                tiles = [
+                    (
+                        theme_file.stem,
+                        output_path / preview_name(source_file, theme_file, first_page),
+                    )
+                    for theme_file in sorted(theme_files)
+                ]
+                tiles = [(label, tile) for label, tile in tiles if tile.is_file()]
+                if not tiles:
+                    continue
+                sheet_file = output_path / f"{source_file.stem}_contact_sheet.png"
+                try:
+                    sheet_width, sheet_height = build_contact_sheet(
+                        tiles,
+                        sheet_file,
+                        contact_sheet_columns,
+                        contact_sheet_tile_width,
+                    )
+                except Exception as e:
+                    console.print(
+                        f"[red]{ERROR_ICON}Could not build contact sheet {sheet_file}: {e}[/red]"
+                    )
+                    continue
+                console.print(
+                    f"[green]{SUCCESS_ICON}Contact sheet:[/green] {sheet_file} ({len(tiles)} tiles, {sheet_width}x{sheet_height})"
                 )
 
-                if success:
-                    console.print(f"[green]{SUCCESS_ICON}Success[/green]")
-                    successful += 1
-                else:
-                    console.print(f"[red]{ERROR_ICON}Failed[/red]")
-                    failed += 1
+        # Print summary
+        summary_text = Text()
+        summary_text.append(
+            f"Processed {len(pairs) + cached} previews ({len(source_files)} sources x {len(theme_files)} themes): "
+        )
+        summary_text.append(f"{successful} successful", style="green")
+        summary_text.append(", ")
+        summary_text.append(f"{cached} cached", style="cyan" if cached > 0 else "dim")
+        summary_text.append(", ")
+        summary_text.append(
+            f"{unchanged} unchanged", style="cyan" if unchanged > 0 else "dim"
+        )
+        summary_text.append(", ")
+        summary_text.append(f"{failed} failed", style="red" if failed > 0 else "dim")
+
+        console.print(f"\n{summary_text}")
 
-                progress.remove_task(task)
+    run_once()
 
-    # Print summary
-    summary_text = Text()
-    summary_text.append(f"Processed {len(source_files)} files: ")
-    summary_text.append(f"{successful} successful", style="green")
-    summary_text.append(", ")
-    summary_text.append(f"{failed} failed", style="red" if failed > 0 else "dim")
+    if watch:
+        console.print(
+            f"\n[dim]{INFO_ICON}Watching {source_path} and {theme_path} for changes (Ctrl+C to stop)[white]...[/white][/dim]"
+        )
+        try:
+            for changed in watch_directories([source_path, theme_path], debounce):
+                names = ", ".join(sorted(f.name for f in changed))
+                console.print(f"\n[bold]{INFO_ICON}Changed:[/bold] {names}")
+                # Sources and themes can be caught half-saved, so a failing
+                # pass is reported and the next change retried
+                try:
+                    run_once(changed)
+                except Exception as e:
+                    console.print(
+                        f"[red]{ERROR_ICON}Pass failed: {type(e).__name__}: {e}[/red]"
+                    )
+                    console.print(
+                        f"[yellow]{WARNING_ICON}Still watching; fix the file and save again.[/yellow]"
+                    )
+        except KeyboardInterrupt:
+            console.print(f"\n[dim]{INFO_ICON}Stopped watching.[/dim]")
 
-    console.print(f"\n{summary_text}")
+    if trace:
+        write_trace(Path(trace))
 
 
 if __name__ == "__main__":
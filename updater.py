@@ -1,66 +1,225 @@
 #!/usr/bin/env python3
 
+import base64
 import difflib
+import hashlib
+import io
+import json
 import os
 import re
+import shutil
+import stat
+import struct
 import subprocess
+import sys
 import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from enum import Enum
 from pathlib import Path
-from typing import Annotated, Dict, List, Optional
+from typing import (
+    IO,
+    Annotated,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 from datetime import datetime, timezone
 
-import requests
 from rich import box
 import typer
 from rich.console import Console
-from rich.prompt import Confirm, Prompt
-from rich.syntax import Syntax
 from rich.table import Table
 
+from common import (
+    CACHE_DIR,
+    ERROR_ICON,
+    HINT_ICON,
+    INFO_ICON,
+    SPINNER_ICON,
+    SUCCESS_ICON,
+    WARNING_ICON,
+    get_github_client,
+    get_latest_github_release,
+    get_latest_github_releases,
+    iter_github_release_pages,
+    write_json_atomic,
+)
+
 # --- Configuration ---
 FLAKE_NIX_PATH = Path("flake.nix")
 VERSIONS_MD_PATH = Path("versions.md")
-# Lines in flake.nix where metadata for versions/hashes is defined.
-# These are 1-based and inclusive.
-FLAKE_METADATA_START_LINE = 28
-FLAKE_METADATA_END_LINE = 33
-FLAKE_METADATA_INDENT = "      "  # 6 spaces
-ERROR_ICON = "󰅙 "
-WARNING_ICON = " "
-SUCCESS_ICON = "󰗠 "
-INFO_ICON = "󰋼 "
-HINT_ICON = "󰌵 "
-SPINNER_ICON = " "
+# The release history versions.md is generated from, oldest first.
+VERSIONS_STORE_PATH = Path("versions.jsonl")
+VERSIONS_MD_HEADER = (
+    "| Iosevkata | Iosevka | nerd-fonts |\n| :-------- | :------ | :--------- |\n"
+)
+# Bindings in flake.nix where metadata for versions/hashes is defined, by
+# their attribute path.
+FLAKE_METADATA_BINDINGS = {
+    "version": "version",
+    "iosevka.version": "iosevka.version",
+    "iosevka.hash": "iosevka.hash",
+    "iosevka.npm_deps_hash": "iosevka.npmDepsHash",
+}
+FLAKE_NERD_FONT_PATCHER_URL = "inputs.nerd-font-patcher.url"
+NERD_FONT_PATCHER_URL_PREFIX = "github:ningw42/nerd-font-patcher/v"
+# Multi-character operators of the Nix language, or any other single character.
+NIX_PUNCTUATION = re.compile(r"==|!=|<=|>=|->|//|\+\+|&&|\|\||\.\.\.|\S")
+NIX_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_'-]*")
+# Hashes of upstream sources, keyed by (url, version, hashing method).
+HASH_CACHE_FILE = CACHE_DIR / "hashes.json"
+HASH_CACHE_VERSION = 1
+HASH_CACHE_MAX_ENTRIES = 256
+HASH_CACHE_MAX_AGE = 90 * 24 * 60 * 60  # seconds
+# Size of the chunks archives are downloaded and hashed in, in bytes.
+NAR_CHUNK_SIZE = 1 << 16
+# Upstream releases tracked by flake.nix, by the prefix of their check outputs.
+UPSTREAMS = {
+    "iosevka": "be5invis/Iosevka",
+    "nerd_font_patcher": "ningw42/nerd-font-patcher",
+}
+
+
+class HashMethod(str, Enum):
+    NAR = "nar"
+    NIX_PREFETCH_URL = "nix-prefetch-url"
+
+
+class BackfillFormat(str, Enum):
+    JSON = "json"
+    TSV = "tsv"
+
+
+class ReportFormat(str, Enum):
+    JSON = "json"
+
+
+class BranchOutput:
+    """
+    A console file that buffers the output of pipeline branches per thread.
 
+    Threads outside of a buffered() block write straight to stdout, so the
+    console behaves as usual until a branch starts.
+    """
 
-console = Console()
+    def __init__(self):
+        self._local = threading.local()
 
+    @contextmanager
+    def buffered(self) -> Iterator[io.StringIO]:
+        self._local.buffer = io.StringIO()
+        try:
+            yield self._local.buffer
+        finally:
+            self._local.buffer = None
 
-def get_latest_github_release(github_repo: str) -> str:
-    repo_url = f"https://api.github.com/repos/{github_repo}/releases/latest"
-    console.print(
-        f"[dim]{SPINNER_ICON}Fetching latest tag for [blue][link={repo_url}]{github_repo}[/link][/blue][white]...[/white][/dim]"
-    )
-    try:
-        response = requests.get(repo_url, timeout=10)
-        response.raise_for_status()
-        tag = response.json()["tag_name"]
-        return tag.lstrip("v")
-    except requests.Timeout:
-        console.print(
-            f"[red]{ERROR_ICON}Timeout while fetching tag for {github_repo} from {repo_url}[/red]"
-        )
-        raise typer.Exit(1)
-    except requests.RequestException as e:
-        console.print(
-            f"[red]{ERROR_ICON}Error fetching tag for {github_repo}: {e}[/red]"
-        )
-        raise typer.Exit(1)
-    except KeyError:
-        console.print(
-            f"[red]{ERROR_ICON}Error: 'tag_name' not found in response for {github_repo}. Response: {response.text}[/red]"
-        )
-        raise typer.Exit(1)
+    def write(self, text: str) -> int:
+        return (getattr(self._local, "buffer", None) or sys.stdout).write(text)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(sys.stdout, name)
+
+
+class BranchError(Exception):
+    """A pipeline branch failed, with the console output it produced."""
+
+    def __init__(self, output: str):
+        super().__init__(output)
+        self.output = output
+
+
+class RunReport:
+    """
+    Records the wall time, CPU time and bytes transferred of each step of a run.
+
+    Steps are attributed per thread, so concurrent pipeline branches record
+    their own. A step's CPU time is its thread's plus that of the commands it
+    ran. Its bytes stay None when the transfer happens outside of Python,
+    e.g. in nix-prefetch-url.
+    """
+
+    def __init__(self):
+        self.steps: List[Dict[str, Any]] = []
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def step(self, name: str, **details: Any) -> Iterator[Dict[str, Any]]:
+        step = {
+            "name": name,
+            "status": "ran",
+            "start_s": time.perf_counter() - self.start,
+            "wall_s": 0.0,
+            "cpu_s": 0.0,
+            "bytes": None,
+            **details,
+        }
+        self._local.step = step
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield step
+        except typer.Exit as e:
+            # Exiting cleanly mid-step means a prompt was declined
+            step["status"] = "failed" if e.exit_code else "aborted"
+            raise
+        except BaseException:
+            step["status"] = "failed"
+            raise
+        finally:
+            step["wall_s"] = time.perf_counter() - wall_start
+            step["cpu_s"] += time.thread_time() - cpu_start
+            self._local.step = None
+            with self._lock:
+                self.steps.append(step)
+
+    def skip(self, name: str, reason: str, **details: Any):
+        with self._lock:
+            self.steps.append(
+                {
+                    "name": name,
+                    "status": "skipped",
+                    "start_s": time.perf_counter() - self.start,
+                    "reason": reason,
+                    **details,
+                }
+            )
+
+    def add_transfer(self, size: int):
+        step = getattr(self._local, "step", None)
+        if step is not None:
+            step["bytes"] = (step["bytes"] or 0) + size
+
+    def add_cpu(self, seconds: float):
+        step = getattr(self._local, "step", None)
+        if step is not None:
+            step["cpu_s"] += seconds
+
+
+branch_output = BranchOutput()
+run_report = RunReport()
+console = Console(file=branch_output)
+app = typer.Typer()
+
+# Set when a pipeline branch fails, to stop the others and kill their commands.
+_cancelled = threading.Event()
+_processes: set = set()
+_processes_lock = threading.Lock()
+
+
+def parse_version(version: str) -> Optional[Tuple[int, int, int]]:
+    """Parses a plain X.Y.Z release version, or returns None for anything else."""
+    match = re.fullmatch(r"(\d+)\.(\d+)\.(\d+)", version)
+    return (int(match[1]), int(match[2]), int(match[3])) if match else None
 
 
 def get_next_version(current_version: str, utc_now: datetime) -> str:
@@ -74,117 +233,337 @@ def get_next_version(current_version: str, utc_now: datetime) -> str:
     return f"{year_month}.{minor}"
 
 
-def extract_metadata(nix_content: str) -> Dict[str, Optional[str]]:
+def skip_nix_interpolation(text: str, i: int) -> int:
+    """Returns the index past the "}" closing an interpolation whose body starts at i."""
+    depth = 1
+    while depth:
+        if i >= len(text):
+            raise ValueError("unterminated interpolation")
+        if text[i] == '"':
+            i = skip_nix_string(text, i)
+            continue
+        if text.startswith("''", i):
+            i = skip_nix_indented_string(text, i)
+            continue
+        if text[i] == "{":
+            depth += 1
+        elif text[i] == "}":
+            depth -= 1
+        i += 1
+    return i
+
+
+def skip_nix_string(text: str, i: int) -> int:
+    """Returns the index past the "..." string starting at i."""
+    i += 1
+    while True:
+        if i >= len(text):
+            raise ValueError("unterminated string")
+        if text[i] == "\\":
+            i += 2
+        elif text[i] == '"':
+            return i + 1
+        elif text.startswith("${", i):
+            i = skip_nix_interpolation(text, i + 2)
+        else:
+            i += 1
+
+
+def skip_nix_indented_string(text: str, i: int) -> int:
+    """Returns the index past the ''...'' string starting at i."""
+    i += 2
+    while True:
+        if i >= len(text):
+            raise ValueError("unterminated indented string")
+        if text.startswith("''\\", i):
+            i += 4
+        elif text.startswith(("'''", "''$"), i):
+            i += 3
+        elif text.startswith("''", i):
+            return i + 2
+        elif text.startswith("${", i):
+            i = skip_nix_interpolation(text, i + 2)
+        else:
+            i += 1
+
+
+def tokenize_nix(text: str) -> List[Tuple[str, int, int]]:
     """
-    Extract specific values from a Nix configuration snippet.
+    Splits Nix source into (kind, start, end) tokens, skipping whitespace and comments.
 
-    Args:
-        nix_content (str): The Nix configuration content as a string
+    Kinds are "string", "indented", "ident" and "punct". Only what's needed to
+    follow bindings is recognized, so numbers and paths come out as punctuation.
+    """
+    tokens = []
+    i = 0
+    while i < len(text):
+        if text[i].isspace():
+            i += 1
+            continue
+        if text[i] == "#":
+            i = text.find("\n", i)
+            if i == -1:
+                break
+            continue
+        if text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            if end == -1:
+                raise ValueError("unterminated comment")
+            i = end + 2
+            continue
+        if text[i] == '"':
+            kind, end = "string", skip_nix_string(text, i)
+        elif text.startswith("''", i):
+            kind, end = "indented", skip_nix_indented_string(text, i)
+        elif match := NIX_IDENTIFIER.match(text, i):
+            kind, end = "ident", match.end()
+        else:
+            kind, end = "punct", NIX_PUNCTUATION.match(text, i).end()
+        tokens.append((kind, i, end))
+        i = end
+    return tokens
+
+
+def find_nix_bindings(text: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Locates the bindings of attribute sets and let blocks to plain strings.
+
+    Bindings are keyed by their attribute path through the sets bound to a
+    name, e.g. iosevka.version for iosevka = { version = "..."; }. Sets that
+    aren't bound to a name, like function and call arguments, are skipped
+    along with everything in them. Paths bound more than once are ambiguous
+    and left out.
 
     Returns:
-        dict: Dictionary containing extracted values with keys:
-              - version
-              - iosevka.version
-              - iosevka.hash
-              - iosevka.npm_deps_hash
+        dict: The span of each string value, quotes included.
+    """
+    tokens = tokenize_nix(text)
+    values = [text[start:end] for _, start, end in tokens]
+    # The attribute path of each enclosing set, or None for a skipped one
+    frames: List[Optional[List[str]]] = []
+    bindings: Dict[str, Tuple[int, int]] = {}
+    ambiguous = set()
+    bound_path: Optional[List[str]] = None
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i][0], values[i]
+        if kind == "punct" and value == "{":
+            if not frames:
+                frames.append([])
+            elif values[i - 1] == "=" and frames[-1] is not None and bound_path:
+                frames.append(bound_path)
+            else:
+                frames.append(None)
+        elif kind == "punct" and value == "}":
+            if frames:
+                frames.pop()
+        elif (
+            kind == "ident"
+            and frames
+            and frames[-1] is not None
+            and values[i - 1] in ("{", ";", "let")
+        ):
+            path = [value]
+            j = i + 1
+            while (
+                j + 1 < len(tokens) and values[j] == "." and tokens[j + 1][0] == "ident"
+            ):
+                path.append(values[j + 1])
+                j += 2
+            if j < len(tokens) and values[j] == "=":
+                bound_path = frames[-1] + path
+                key = ".".join(bound_path)
+                if (
+                    j + 2 < len(tokens)
+                    and tokens[j + 1][0] == "string"
+                    and values[j + 2] == ";"
+                ):
+                    if key in bindings:
+                        ambiguous.add(key)
+                    bindings[key] = tokens[j + 1][1:]
+                i = j + 1
+                continue
+        bound_path = None
+        i += 1
+    for key in ambiguous:
+        del bindings[key]
+    return bindings
+
+
+def nix_string(value: str) -> str:
+    """Quotes a value as a Nix string literal."""
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("${", "\\${")
+    return f'"{escaped}"'
+
+
+class FlakeDocument:
     """
-    result = {}
+    flake.nix, read and tokenized once, with edits staged in memory.
 
-    # Extract main version
-    version_match = re.search(r'version\s*=\s*"([^"]+)"', nix_content)
-    if version_match:
-        result["version"] = version_match.group(1)
+    Edits replace only the string literals of the bindings they target, so
+    formatting and comments are kept, and save() writes all of them at once
+    through an atomic rename.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.text = path.read_text()
+        self.bindings = find_nix_bindings(self.text)
+        self.edits: Dict[str, str] = {}
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the (edited) value of a binding. Metadata values have no escapes."""
+        if key in self.edits:
+            return self.edits[key]
+        span = self.bindings.get(key)
+        return self.text[span[0] + 1 : span[1] - 1] if span else None
+
+    def set(self, key: str, value: str):
+        if key not in self.bindings:
+            raise KeyError(key)
+        self.edits[key] = value
+
+    def render(self) -> str:
+        text = self.text
+        # Splice from the end, so earlier spans stay valid
+        for key in sorted(self.edits, key=self.bindings.get, reverse=True):
+            start, end = self.bindings[key]
+            text = text[:start] + nix_string(self.edits[key]) + text[end:]
+        return text
+
+    def save(self):
+        text = self.render()
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.path.parent, prefix=f".{self.path.name}.", delete=False
+        ) as tmp:
+            tmp.write(text)
+        shutil.copymode(self.path, tmp.name)
+        os.replace(tmp.name, self.path)
+        self.text = text
+        self.bindings = find_nix_bindings(text)
+        self.edits = {}
 
-    # Extract iosevka section values
-    iosevka_section = re.search(r"iosevka\s*=\s*{([^}]+)}", nix_content, re.DOTALL)
-    if iosevka_section:
-        iosevka_content = iosevka_section.group(1)
 
-        # Extract iosevka version
-        iosevka_version = re.search(r'version\s*=\s*"([^"]+)"', iosevka_content)
-        if iosevka_version:
-            result["iosevka.version"] = iosevka_version.group(1)
+def load_flake(flake_path: Path) -> FlakeDocument:
+    if not flake_path.exists():
+        console.print(f"[red]{ERROR_ICON}Error: {flake_path} not found.[/red]")
+        raise typer.Exit(1)
+    try:
+        return FlakeDocument(flake_path)
+    except ValueError as e:
+        console.print(f"[red]{ERROR_ICON}Error parsing {flake_path}: {e}[/red]")
+        raise typer.Exit(1)
+
 
-        # Extract iosevka hash
-        iosevka_hash = re.search(r'hash\s*=\s*"([^"]+)"', iosevka_content)
-        if iosevka_hash:
-            result["iosevka.hash"] = iosevka_hash.group(1)
+class VersionHistory:
+    """
+    The release history of Iosevkata, indexed in both directions.
 
-        # Extract iosevka npmDepsHash
-        npm_deps_hash = re.search(r'npmDepsHash\s*=\s*"([^"]+)"', iosevka_content)
-        if npm_deps_hash:
-            result["iosevka.npm_deps_hash"] = npm_deps_hash.group(1)
+    Releases are stored oldest first, one JSON object per line, so recording
+    a release is a single append. Lookups by Iosevkata version, and by the
+    Iosevka or nerd-fonts version a release was built from, go through
+    in-memory indexes built on load.
+    """
 
-    return result
+    def __init__(self, path: Path):
+        self.path = path
+        self.releases: List[Dict[str, str]] = []
+        self.by_iosevkata: Dict[str, Dict[str, str]] = {}
+        self.by_iosevka: Dict[str, List[Dict[str, str]]] = {}
+        self.by_nerdfonts: Dict[str, List[Dict[str, str]]] = {}
+        if path.exists():
+            for number, line in enumerate(path.read_text().splitlines(), 1):
+                if not line.strip():
+                    continue
+                try:
+                    release = json.loads(line)
+                    self.add(
+                        release["iosevkata"], release["iosevka"], release["nerdfonts"]
+                    )
+                except (ValueError, KeyError, TypeError) as e:
+                    raise ValueError(f"line {number}: {e}") from e
+
+    def add(self, iosevkata: str, iosevka: str, nerdfonts: str) -> Dict[str, str]:
+        """Indexes a new latest release, refusing an Iosevkata version that's already taken."""
+        if iosevkata in self.by_iosevkata:
+            raise ValueError(f"Iosevkata v{iosevkata} is already recorded")
+        release = {"iosevkata": iosevkata, "iosevka": iosevka, "nerdfonts": nerdfonts}
+        self.releases.append(release)
+        self.by_iosevkata[iosevkata] = release
+        self.by_iosevka.setdefault(iosevka, []).append(release)
+        self.by_nerdfonts.setdefault(nerdfonts, []).append(release)
+        return release
+
+    def append(self, release: Dict[str, str]):
+        """Records an added release in the store."""
+        with open(self.path, "a") as store:
+            store.write(json.dumps(release) + "\n")
+
+    def find(
+        self,
+        iosevkata: Optional[str] = None,
+        iosevka: Optional[str] = None,
+        nerdfonts: Optional[str] = None,
+    ) -> List[Dict[str, str]]:
+        """Returns the releases matching every given version, newest first."""
+        candidates = self.releases
+        if iosevkata is not None:
+            release = self.by_iosevkata.get(iosevkata)
+            candidates = [release] if release else []
+        elif iosevka is not None:
+            candidates = self.by_iosevka.get(iosevka, [])
+        elif nerdfonts is not None:
+            candidates = self.by_nerdfonts.get(nerdfonts, [])
+        return [
+            release
+            for release in reversed(candidates)
+            if (iosevka is None or release["iosevka"] == iosevka)
+            and (nerdfonts is None or release["nerdfonts"] == nerdfonts)
+        ]
 
 
-def extract_value(regex: str, flake_content: str) -> Optional[str]:
-    """Extracts single value by key."""
-    match = re.search(regex, flake_content)
-    return match.group(1) if match else None
+def load_version_history(store_path: Path) -> VersionHistory:
+    try:
+        return VersionHistory(store_path)
+    except (OSError, ValueError) as e:
+        console.print(f"[red]{ERROR_ICON}Error reading {store_path}: {e}[/red]")
+        raise typer.Exit(1)
 
 
-def extract_version(key: str, flake_content: str) -> Optional[str]:
-    """Extracts a version string (e.g., "X.Y.Z" or "X.Y.Z-suffix") for a given key."""
-    return extract_value(
-        rf'{key}\s*=\s*"([0-9]+\.[0-9]+\.[0-9]+(?:-[a-zA-Z0-9.]+)?)"\s*;',
-        flake_content,
-    )
+def render_versions_row(release: Dict[str, str]) -> str:
+    return f"| {'v' + release['iosevkata']:<9} | {'v' + release['iosevka']:<7} | {'v' + release['nerdfonts']:<10} |\n"
 
 
-def extract_sri_hash(key: str, flake_content: str) -> Optional[str]:
-    """Extracts a SRI hash string for a given key."""
-    return extract_value(
-        rf'{key}\s*=\s*"(sha256-[A-Za-z0-9+\/]{{43}}={{0,2}})"\s*;',
-        flake_content,
+def render_versions_md(history: VersionHistory) -> str:
+    return VERSIONS_MD_HEADER + "".join(
+        render_versions_row(release) for release in reversed(history.releases)
     )
 
 
-def get_nerdfonts_version(flake_path: Path) -> str:
+def get_nerdfonts_version(flake: FlakeDocument) -> str:
     """Extracts the nerd-fonts version from the nerd-font-patcher input URL tag in flake.nix."""
-    with open(flake_path, "r") as flake:
-        content = flake.read()
-    match = re.search(
-        r'nerd-font-patcher\.url\s*=\s*"github:ningw42/nerd-font-patcher/v([^"]+)"',
-        content,
-    )
-    if not match:
+    url = flake.get(FLAKE_NERD_FONT_PATCHER_URL)
+    if not url or not url.startswith(NERD_FONT_PATCHER_URL_PREFIX):
         console.print(
-            f"[red]{ERROR_ICON}Could not extract nerd-font-patcher version from {flake_path}. "
-            f"Expected input URL format: github:ningw42/nerd-font-patcher/vX.Y.Z[/red]"
+            f"[red]{ERROR_ICON}Could not extract nerd-font-patcher version from {flake.path}. "
+            f"Expected input URL format: {NERD_FONT_PATCHER_URL_PREFIX}X.Y.Z[/red]"
         )
         raise typer.Exit(1)
-    return match.group(1)
+    return url[len(NERD_FONT_PATCHER_URL_PREFIX) :]
 
 
-def update_nerdfonts_version(flake_path: Path, new_version: str):
-    """Updates the nerd-font-patcher input URL tag in flake.nix."""
-    with open(flake_path, "r") as flake:
-        content = flake.read()
-    updated = re.sub(
-        r'(nerd-font-patcher\.url\s*=\s*"github:ningw42/nerd-font-patcher/v)[^"]+(")',
-        rf"\g<1>{new_version}\2",
-        content,
-    )
-    with open(flake_path, "w") as flake:
-        flake.write(updated)
-    console.print(
-        f"\n[green]{SUCCESS_ICON}Updated nerd-font-patcher input to v{new_version} in {flake_path}.[/green]"
-    )
-
+def get_current_metadata(flake: FlakeDocument) -> Dict[str, Optional[str]]:
+    """
+    Extracts the metadata values from flake.nix.
 
-def get_current_metadata(flake_path: Path) -> Dict[str, Optional[str]]:
-    if not flake_path.exists():
-        console.print(f"[red]{ERROR_ICON}Error: {flake_path} not found.[/red]")
-        raise typer.Exit(1)
-    with open(flake_path, "r") as flake:
-        metadata_lines = flake.readlines()[
-            FLAKE_METADATA_START_LINE - 1 : FLAKE_METADATA_END_LINE
-        ]
-        metadata_content = "".join(metadata_lines)
-        metadata = extract_metadata(metadata_content)
-        metadata["raw"] = metadata_content
-        return metadata
+    Returns:
+        dict: Dictionary containing extracted values with keys:
+              - version
+              - iosevka.version
+              - iosevka.hash
+              - iosevka.npm_deps_hash
+    """
+    return {key: flake.get(path) for key, path in FLAKE_METADATA_BINDINGS.items()}
 
 
 def get_highlighted_metadata_row(
@@ -201,27 +580,274 @@ def get_highlighted_metadata_row(
 
 
 def run_nix_command(command_parts: List[str]) -> str:
-    """Runs a Nix command and returns its stripped stdout."""
+    """Runs a Nix command and returns its stripped stdout, unless cancelled."""
     try:
         # For debugging: console.print(f"[dim]$ {' '.join(command_parts)}[/dim]")
-        result = subprocess.run(
-            command_parts, capture_output=True, text=True, check=True, shell=False
+        with _processes_lock:
+            if _cancelled.is_set():
+                raise typer.Exit(1)
+            # stderr is spooled to a file, so stdout can be drained before
+            # the command is reaped with wait4() for its CPU time
+            stderr_file = tempfile.TemporaryFile("w+")
+            process = subprocess.Popen(
+                command_parts,
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+                text=True,
+                shell=False,
+            )
+            _processes.add(process)
+    except FileNotFoundError:
+        stderr_file.close()
+        console.print(
+            f"[red]{ERROR_ICON}Error: Command '{command_parts[0]}' not found. Is it installed and in PATH?[/red]"
         )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
+        raise typer.Exit(1)
+    try:
+        with process.stdout:
+            stdout = process.stdout.read()
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            run_report.add_cpu(usage.ru_utime + usage.ru_stime)
+        except ChildProcessError:
+            # Already reaped by process.kill() in cancel_branches()
+            process.wait()
+        with stderr_file:
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+    finally:
+        with _processes_lock:
+            _processes.discard(process)
+    if process.returncode != 0:
+        if _cancelled.is_set():
+            # Killed by cancel_branches(), the failing branch reports the error
+            raise typer.Exit(1)
         console.print(
             f"[red]{ERROR_ICON}Error running command: {' '.join(command_parts)}[/red]"
         )
-        if e.stdout:
-            console.print(f"[bold red]Stdout:[/bold red]\n{e.stdout}")
-        if e.stderr:
-            console.print(f"[bold red]Stderr:[/bold red]\n{e.stderr}")
+        if stdout:
+            console.print(f"[bold red]Stdout:[/bold red]\n{stdout}")
+        if stderr:
+            console.print(f"[bold red]Stderr:[/bold red]\n{stderr}")
         raise typer.Exit(1)
-    except FileNotFoundError:
+    return stdout.strip()
+
+
+def load_hash_cache() -> Dict[str, Dict[str, Any]]:
+    """Loads the unexpired entries of the hash cache, or nothing if it's unreadable."""
+    try:
+        cache = json.loads(HASH_CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != HASH_CACHE_VERSION:
+        return {}
+    now = time.time()
+    return {
+        key: entry
+        for key, entry in cache.get("entries", {}).items()
+        if now - entry.get("created", 0) <= HASH_CACHE_MAX_AGE
+    }
+
+
+def save_hash_cache(entries: Dict[str, Dict[str, Any]]):
+    """Writes the hash cache atomically, evicting the least recently used entries."""
+    kept = dict(
+        sorted(entries.items(), key=lambda item: item[1].get("used", 0))[
+            -HASH_CACHE_MAX_ENTRIES:
+        ]
+    )
+    try:
+        HASH_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(
+            HASH_CACHE_FILE, {"version": HASH_CACHE_VERSION, "entries": kept}
+        )
+    except OSError as e:
+        # The cache is an optimization only
         console.print(
-            f"[red]{ERROR_ICON}Error: Command '{command_parts[0]}' not found. Is it installed and in PATH?[/red]"
+            f"[yellow]{WARNING_ICON}Could not write hash cache {HASH_CACHE_FILE}: {e}[/yellow]"
         )
+
+
+_hash_cache_lock = threading.Lock()
+
+
+def cached_hash(
+    url: str,
+    version: str,
+    method: str,
+    compute: Callable[[], str],
+    use_cache: bool,
+    steps: Tuple[str, ...] = (),
+) -> str:
+    """
+    Returns the hash of an upstream source from the cache, or computes and caches it.
+
+    Entries are keyed by (url, version, method), so a different hashing method
+    never reuses another's result. On a hit, the report steps compute would
+    have run are recorded as skipped.
+    """
+    key = json.dumps([url, version, method])
+    if use_cache:
+        with _hash_cache_lock:
+            entries = load_hash_cache()
+            entry = entries.get(key)
+            if entry is not None:
+                console.print(
+                    f"[dim]{INFO_ICON}Using cached [link={url}][blue]{method}[/blue][/link] hash for [yellow not bold]v{version}[/yellow not bold][/dim]"
+                )
+                entry["used"] = time.time()
+                save_hash_cache(entries)
+                for step in steps:
+                    run_report.skip(step, "cached", version=version)
+                return entry["hash"]
+
+    value = compute()
+    with _hash_cache_lock:
+        # Re-read, so concurrent branches don't drop each other's entries
+        entries = load_hash_cache()
+        now = time.time()
+        entries[key] = {"hash": value, "created": now, "used": now}
+        save_hash_cache(entries)
+    return value
+
+
+def cancel_branches():
+    """Stops pipeline branches from starting commands and kills running ones."""
+    with _processes_lock:
+        _cancelled.set()
+        for process in _processes:
+            process.kill()
+
+
+def run_branch(function: Callable[..., Any], *args: Any) -> Tuple[Any, str]:
+    """Runs a pipeline branch, returning its result and buffered console output."""
+    with branch_output.buffered() as buffer:
+        try:
+            return function(*args), buffer.getvalue()
+        except Exception as e:
+            raise BranchError(buffer.getvalue()) from e
+
+
+def hash_iosevka_archive(
+    version: str,
+    use_cache: bool = True,
+    hash_method: HashMethod = HashMethod.NIX_PREFETCH_URL,
+) -> str:
+    """Returns the SRI hash of an Iosevka release's source archive, from the cache if possible."""
+    url = f"https://github.com/be5invis/Iosevka/archive/refs/tags/v{version}.zip"
+    fetch = (
+        fetch_sri_hash_with_nar
+        if hash_method == HashMethod.NAR
+        else fetch_sri_hash_with_nix_prefetch_url
+    )
+
+    def compute() -> str:
+        with run_report.step("archive_hash", version=version, method=hash_method.value):
+            return fetch("be5invis/Iosevka", version, url, strip_root=True)
+
+    return cached_hash(
+        url, version, hash_method.value, compute, use_cache, steps=("archive_hash",)
+    )
+
+
+def hash_iosevka_npm_deps(version: str, use_cache: bool = True) -> str:
+    """Returns the npmDepsHash of an Iosevka release, from the cache if possible."""
+    return cached_hash(
+        f"https://raw.githubusercontent.com/be5invis/Iosevka/v{version}/package-lock.json",
+        version,
+        "prefetch-npm-deps",
+        lambda: fetch_npm_deps_hash_for_iosevka(version),
+        use_cache,
+        steps=("package_lock_download", "prefetch_npm_deps"),
+    )
+
+
+def resolve_targets(
+    target_iosevka_version: Optional[str],
+    target_nerdfonts_version: Optional[str],
+    use_cache: bool = True,
+    hash_method: HashMethod = HashMethod.NIX_PREFETCH_URL,
+) -> Tuple[str, str, str, str]:
+    """
+    Resolves the target versions and Iosevka hashes as a concurrent pipeline.
+
+    Both GitHub lookups start at once, and the archive and npm dependencies
+    are hashed as soon as the Iosevka version is known. The console output
+    of each branch is replayed in the order a sequential run would print it.
+    The first failing branch cancels the others. Hashes are reused from the
+    hash cache unless use_cache is False. The archive is hashed with
+    hash_method.
+
+    Returns:
+        tuple: Iosevka version, nerd-font-patcher version, Iosevka hash and
+               Iosevka npmDepsHash.
+    """
+
+    def resolve_version(github_repo: str, version: Optional[str]) -> str:
+        if version:
+            run_report.skip("github_lookup", "version given", repo=github_repo)
+            return version
+        with run_report.step("github_lookup", repo=github_repo):
+            return get_latest_github_release(github_repo, console)
+
+    order = ["iosevka", "nerdfonts", "hash", "npm_deps_hash"]
+    results: Dict[str, Tuple[Any, str]] = {}
+    replayed = 0
+    executor = ThreadPoolExecutor(max_workers=len(order))
+    branches: Dict[Future, str] = {
+        executor.submit(
+            run_branch, resolve_version, "be5invis/Iosevka", target_iosevka_version
+        ): "iosevka",
+        executor.submit(
+            run_branch,
+            resolve_version,
+            "ningw42/nerd-font-patcher",
+            target_nerdfonts_version,
+        ): "nerdfonts",
+    }
+    try:
+        while len(results) < len(order):
+            running = [f for f, name in branches.items() if name not in results]
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = branches[future]
+                results[name] = future.result()
+                if name == "iosevka":
+                    version = results[name][0]
+                    branches[
+                        executor.submit(
+                            run_branch,
+                            hash_iosevka_archive,
+                            version,
+                            use_cache,
+                            hash_method,
+                        )
+                    ] = "hash"
+                    branches[
+                        executor.submit(
+                            run_branch, hash_iosevka_npm_deps, version, use_cache
+                        )
+                    ] = "npm_deps_hash"
+            while replayed < len(order) and order[replayed] in results:
+                branch_output.write(results[order[replayed]][1])
+                replayed += 1
+    except BranchError as e:
+        cancel_branches()
+        for name in order[replayed:]:
+            if name in results:
+                branch_output.write(results[name][1])
+        branch_output.write(e.output)
         raise typer.Exit(1)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return (
+        results["iosevka"][0],
+        results["nerdfonts"][0],
+        results["hash"][0],
+        results["npm_deps_hash"][0],
+    )
 
 
 def fetch_sri_hash_with_nix_prefetch(
@@ -274,17 +900,169 @@ def fetch_sri_hash_with_nix_prefetch_url(
     return run_nix_command(["nix", "hash", "convert", f"sha256:{sha_hash}"])
 
 
+def nar_string(data: bytes) -> bytes:
+    """Serializes a NAR string: its length as a u64, the bytes, and zero padding."""
+    return struct.pack("<Q", len(data)) + data + b"\0" * (-len(data) % 8)
+
+
+def hash_nar_node(
+    digest: Any,
+    archive: zipfile.ZipFile,
+    node: Union[Dict[bytes, Any], zipfile.ZipInfo],
+):
+    """Feeds the NAR serialization of an archive entry, or a directory of them, to digest."""
+    digest.update(nar_string(b"(") + nar_string(b"type"))
+    if isinstance(node, dict):
+        digest.update(nar_string(b"directory"))
+        # NAR sorts entries by the bytes of their names
+        for name in sorted(node):
+            digest.update(
+                nar_string(b"entry")
+                + nar_string(b"(")
+                + nar_string(b"name")
+                + nar_string(name)
+                + nar_string(b"node")
+            )
+            hash_nar_node(digest, archive, node[name])
+            digest.update(nar_string(b")"))
+    else:
+        mode = node.external_attr >> 16
+        if stat.S_ISLNK(mode):
+            digest.update(
+                nar_string(b"symlink")
+                + nar_string(b"target")
+                + nar_string(archive.read(node))
+            )
+        else:
+            digest.update(nar_string(b"regular"))
+            if mode & stat.S_IXUSR:
+                digest.update(nar_string(b"executable") + nar_string(b""))
+            digest.update(nar_string(b"contents") + struct.pack("<Q", node.file_size))
+            with archive.open(node) as entry:
+                while chunk := entry.read(NAR_CHUNK_SIZE):
+                    digest.update(chunk)
+            digest.update(b"\0" * (-node.file_size % 8))
+    digest.update(nar_string(b")"))
+
+
+def hash_zip_as_nar(archive_file: IO[bytes], strip_root: bool) -> str:
+    """
+    Computes the SRI hash of a zip archive's unpacked content, as fetchzip does.
+
+    Entries are walked in NAR order and streamed through sha256 without being
+    extracted. With strip_root, the archive's single top-level directory
+    becomes the root, like fetchzip's stripRoot and nix-prefetch-url --unpack.
+    """
+    with zipfile.ZipFile(archive_file) as archive:
+        root: Dict[bytes, Any] = {}
+        for info in archive.infolist():
+            # Names are unpacked as their raw bytes, which zipfile decoded as
+            # cp437 unless the entry is flagged as UTF-8
+            encoding = "utf-8" if info.flag_bits & 0x800 else "cp437"
+            raw_name = info.filename.encode(encoding)
+            parts = [part for part in raw_name.split(b"/") if part]
+            if not parts:
+                continue
+            parent = root
+            for part in parts[:-1]:
+                parent = parent.setdefault(part, {})
+            if info.is_dir():
+                parent.setdefault(parts[-1], {})
+            else:
+                parent[parts[-1]] = info
+        if strip_root:
+            if len(root) != 1 or not isinstance(next(iter(root.values())), dict):
+                raise ValueError("expected a single top-level directory to strip")
+            root = next(iter(root.values()))
+
+        digest = hashlib.sha256(nar_string(b"nix-archive-1"))
+        hash_nar_node(digest, archive, root)
+    return f"sha256-{base64.b64encode(digest.digest()).decode()}"
+
+
+def fetch_sri_hash_with_nar(name: str, version: str, url: str, strip_root: bool) -> str:
+    """
+    Fetches SRI hash for an archive's content in-process, without nix.
+    Produces the same SRI hash string as fetchzip (e.g., "sha256-Abc...=").
+    """
+    import requests
+
+    console.print(
+        f"[dim]{SPINNER_ICON}Calculating SRI hash for [link={url}][blue]{name}[/blue][/link] [yellow not bold]v{version}[/yellow not bold] (strip_root={strip_root}) using an in-process NAR hash[white]...[/white][/dim]"
+    )
+    try:
+        # Zip entries can only be walked in NAR order from the central
+        # directory at the end, so the archive is spooled to an anonymous
+        # temporary file first, never extracted
+        with get_github_client().session.get(
+            url, stream=True, timeout=10
+        ) as response, tempfile.TemporaryFile() as archive_file:
+            response.raise_for_status()
+            for chunk in response.iter_content(NAR_CHUNK_SIZE):
+                if _cancelled.is_set():
+                    raise typer.Exit(1)
+                archive_file.write(chunk)
+                run_report.add_transfer(len(chunk))
+            archive_file.seek(0)
+            return hash_zip_as_nar(archive_file, strip_root)
+    except requests.Timeout:
+        console.print(f"[red]{ERROR_ICON}Error: Timeout while fetching {url}[/red]")
+        raise typer.Exit(1)
+    except requests.RequestException as e:
+        console.print(
+            f"[red]{ERROR_ICON}Error fetching {name} v{version} from {url}: {e}[/red]"
+        )
+        raise typer.Exit(1)
+    except (zipfile.BadZipFile, ValueError) as e:
+        console.print(
+            f"[red]{ERROR_ICON}Error hashing {name} v{version} archive: {e}[/red]"
+        )
+        raise typer.Exit(1)
+
+
+def write_nar_fixture(archive_path: Path):
+    """
+    Writes a zip exercising everything hash_zip_as_nar handles, under a
+    single root directory: nested and empty directories, an empty file, an
+    executable, a symlink, a non-ASCII name and names whose byte order
+    differs from their case-insensitive order.
+    """
+    entries = [
+        ("fixture/", stat.S_IFDIR | 0o755, b""),
+        ("fixture/README.md", stat.S_IFREG | 0o644, b"# fixture\n"),
+        ("fixture/empty.txt", stat.S_IFREG | 0o644, b""),
+        ("fixture/build.sh", stat.S_IFREG | 0o755, b"#!/bin/sh\necho ok\n"),
+        ("fixture/link", stat.S_IFLNK | 0o777, b"README.md"),
+        ("fixture/b.txt", stat.S_IFREG | 0o644, b"lower\n"),
+        ("fixture/B.txt", stat.S_IFREG | 0o644, b"upper\n"),
+        ("fixture/caf\u00e9.txt", stat.S_IFREG | 0o644, b"non-ascii\n"),
+        ("fixture/empty-dir/", stat.S_IFDIR | 0o755, b""),
+        ("fixture/src/", stat.S_IFDIR | 0o755, b""),
+        ("fixture/src/main.js", stat.S_IFREG | 0o644, b"x" * (NAR_CHUNK_SIZE + 3)),
+    ]
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, mode, data in entries:
+            info = zipfile.ZipInfo(name)
+            info.create_system = 3  # unix, so unpackers honor the mode
+            info.external_attr = mode << 16 | (0x10 if stat.S_ISDIR(mode) else 0)
+            archive.writestr(info, data)
+
+
 def fetch_npm_deps_hash_for_iosevka(iosevka_version: str) -> str:
     """Fetches Iosevka's package-lock.json and calculates its prefetch hash using prefetch-npm-deps."""
+    import requests
+
     url = f"https://raw.githubusercontent.com/be5invis/Iosevka/v{iosevka_version}/package-lock.json"
     console.print(
         f"[dim]{SPINNER_ICON}Calculating NPM dependencies hash for [link={url}][blue]be5invis/Iosevka[/blue][/link] [yellow not bold]v{iosevka_version}[/yellow not bold] using prefetch-npm-deps[white]...[/white][/dim]"
     )
 
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        package_lock_content = response.content
+        with run_report.step("package_lock_download", version=iosevka_version):
+            response = get_github_client().session.get(url, timeout=10)
+            response.raise_for_status()
+            package_lock_content = response.content
+            run_report.add_transfer(len(package_lock_content))
     except requests.Timeout:
         console.print(f"[red]{ERROR_ICON}Error: Timeout while fetching {url}[/red]")
         raise typer.Exit(1)
@@ -301,7 +1079,8 @@ def fetch_npm_deps_hash_for_iosevka(iosevka_version: str) -> str:
         ) as tmp_file:
             tmp_file.write(package_lock_content)
             tmp_file_path = tmp_file.name
-        sri_hash = run_nix_command(["prefetch-npm-deps", tmp_file_path])
+        with run_report.step("prefetch_npm_deps", version=iosevka_version):
+            sri_hash = run_nix_command(["prefetch-npm-deps", tmp_file_path])
     finally:
         if tmp_file_path and os.path.exists(tmp_file_path):
             os.unlink(tmp_file_path)
@@ -309,6 +1088,8 @@ def fetch_npm_deps_hash_for_iosevka(iosevka_version: str) -> str:
 
 
 def show_diff(old_content: str, new_content: str, from_file: str, to_file: str):
+    from rich.syntax import Syntax
+
     diff_lines = difflib.unified_diff(
         old_content.strip("\n").splitlines(),
         new_content.strip("\n").splitlines(),
@@ -327,35 +1108,31 @@ def show_diff(old_content: str, new_content: str, from_file: str, to_file: str):
     )
 
 
-def update_flake_metadata(metadata_content: str):
-    with open(FLAKE_NIX_PATH, "r") as flake:
-        lines = flake.readlines()
-    with open(FLAKE_NIX_PATH, "w") as flake:
-        lines[FLAKE_METADATA_START_LINE - 1 : FLAKE_METADATA_END_LINE] = (
-            metadata_content.splitlines(keepends=True)
-        )
-        flake.writelines(lines)
-
-
 def patch_flake(
-    current_metadata_str: str,
+    flake: FlakeDocument,
     target_iosevkata_version: str,
     target_iosevka_version: str,
     target_iosevka_hash: str,
     target_iosevka_npm_deps_hash: str,
+    target_nerdfonts_version: Optional[str] = None,
     no_confirm: bool = False,
 ):
-    target_metadata_str = f"""\
-{FLAKE_METADATA_INDENT}version = "{target_iosevkata_version}";
-{FLAKE_METADATA_INDENT}iosevka = {{
-{FLAKE_METADATA_INDENT}  version = "{target_iosevka_version}";
-{FLAKE_METADATA_INDENT}  hash = "{target_iosevka_hash}";
-{FLAKE_METADATA_INDENT}  npmDepsHash = "{target_iosevka_npm_deps_hash}";
-{FLAKE_METADATA_INDENT}}};
-"""
+    from rich.prompt import Confirm
+
+    flake.set(FLAKE_METADATA_BINDINGS["version"], target_iosevkata_version)
+    flake.set(FLAKE_METADATA_BINDINGS["iosevka.version"], target_iosevka_version)
+    flake.set(FLAKE_METADATA_BINDINGS["iosevka.hash"], target_iosevka_hash)
+    flake.set(
+        FLAKE_METADATA_BINDINGS["iosevka.npm_deps_hash"], target_iosevka_npm_deps_hash
+    )
+    if target_nerdfonts_version is not None:
+        flake.set(
+            FLAKE_NERD_FONT_PATCHER_URL,
+            f"{NERD_FONT_PATCHER_URL_PREFIX}{target_nerdfonts_version}",
+        )
     show_diff(
-        current_metadata_str,
-        target_metadata_str,
+        flake.text,
+        flake.render(),
         "current flake.nix",
         "target flake.nix",
     )
@@ -366,24 +1143,48 @@ def patch_flake(
             f"[yellow]{WARNING_ICON}Aborted. flake.nix wasn't changed.[/yellow]"
         )
         raise typer.Exit()
-    update_flake_metadata(target_metadata_str)
+    flake.save()
+    if target_nerdfonts_version is not None:
+        console.print(
+            f"\n[green]{SUCCESS_ICON}Updated nerd-font-patcher input to v{target_nerdfonts_version} in {flake.path}.[/green]"
+        )
     console.print(f"\n[green]{SUCCESS_ICON}Successfully updated flake.nix.[/green]")
 
 
 def patch_versions(
+    history: VersionHistory,
     iosevkata_version: str,
     iosevka_version: str,
     nerdfonts_version: str,
     no_confirm: bool = False,
 ):
-    with open(VERSIONS_MD_PATH, "r") as versions:
-        versions_lines = versions.readlines()
-    current_versions_str = "".join(versions_lines)
-    line_to_insert = (
-        f"| v{iosevkata_version}  | v{iosevka_version} | v{nerdfonts_version}     |\n"
+    from rich.prompt import Confirm
+
+    current_versions_str = (
+        VERSIONS_MD_PATH.read_text() if VERSIONS_MD_PATH.exists() else ""
+    )
+    latest = history.releases[-1] if history.releases else None
+    try:
+        release = history.add(iosevkata_version, iosevka_version, nerdfonts_version)
+    except ValueError as e:
+        console.print(f"[red]{ERROR_ICON}Error: {e} in {history.path}.[/red]")
+        raise typer.Exit(1)
+    # Splice the new row in below the header, unless versions.md has drifted
+    # from the store, in which case it's regenerated in full
+    in_sync_prefix = VERSIONS_MD_HEADER + (
+        render_versions_row(latest) if latest else ""
     )
-    versions_lines.insert(2, line_to_insert)
-    target_versions_str = "".join(versions_lines)
+    if current_versions_str.startswith(in_sync_prefix):
+        target_versions_str = (
+            VERSIONS_MD_HEADER
+            + render_versions_row(release)
+            + current_versions_str[len(VERSIONS_MD_HEADER) :]
+        )
+    else:
+        console.print(
+            f"[yellow]{WARNING_ICON}{VERSIONS_MD_PATH} is out of sync with {history.path}, regenerating it.[/yellow]"
+        )
+        target_versions_str = render_versions_md(history)
     show_diff(
         current_versions_str,
         target_versions_str,
@@ -397,14 +1198,16 @@ def patch_versions(
             f"[yellow]{WARNING_ICON}Aborted. versions.md wasn't changed.[/yellow]"
         )
         raise typer.Exit()
-    with open(VERSIONS_MD_PATH, "w") as versions:
-        versions.writelines(versions_lines)
-        console.print(
-            f"\n[green]{SUCCESS_ICON}Successfully updated versions.md.[/green]"
-        )
+    history.append(release)
+    VERSIONS_MD_PATH.write_text(target_versions_str)
+    console.print(
+        f"\n[green]{SUCCESS_ICON}Successfully updated {history.path} and versions.md.[/green]"
+    )
 
 
+@app.callback(invoke_without_command=True)
 def main(
+    ctx: typer.Context,
     target_iosevka_version: Annotated[
         Optional[str],
         typer.Option(
@@ -423,45 +1226,104 @@ def main(
             help="Skip all interactive prompts, auto-accepting defaults. Useful for CI."
         ),
     ] = False,
+    no_cache: Annotated[
+        bool,
+        typer.Option(
+            help="Recompute the Iosevka hashes instead of reusing cached ones."
+        ),
+    ] = False,
+    hash_method: Annotated[
+        HashMethod,
+        typer.Option(
+            help="How to hash the Iosevka source archive: with nix-prefetch-url, or in-process (verify it with check-nar-hash first)."
+        ),
+    ] = HashMethod.NIX_PREFETCH_URL,
+    report: Annotated[
+        Optional[ReportFormat],
+        typer.Option(
+            help="Print a machine-readable report of the run, with per-step timings, to stdout. Console output moves to stderr."
+        ),
+    ] = None,
 ):
-    # figure out target dependency versions
-    if not target_iosevka_version:
-        target_iosevka_version = get_latest_github_release("be5invis/Iosevka")
+    """Update flake.nix and versions.md to the latest (or given) upstream releases."""
+    if ctx.invoked_subcommand is not None:
+        return
 
-    if not target_nerdfonts_version:
-        target_nerdfonts_version = get_latest_github_release(
-            "ningw42/nerd-font-patcher"
+    if report is None:
+        update(
+            target_iosevka_version,
+            target_nerdfonts_version,
+            no_confirm,
+            not no_cache,
+            hash_method,
+            {},
         )
+        return
 
-    # current nerd-fonts version from flake input URL
-    current_nerdfonts_version = get_nerdfonts_version(FLAKE_NIX_PATH)
-
-    # fetch target dependency hashes
-    target_iosevka_hash = fetch_sri_hash_with_nix_prefetch_url(
-        "be5invis/Iosevka",
-        target_iosevka_version,
-        f"https://github.com/be5invis/Iosevka/archive/refs/tags/v{target_iosevka_version}.zip",
-        strip_root=True,
-    )
-    target_iosevka_npm_deps_hash = fetch_npm_deps_hash_for_iosevka(
-        target_iosevka_version
-    )
+    result: Dict[str, Any] = {"status": "failed"}
+    get_github_client().on_transfer = run_report.add_transfer
+    exit_code = 0
+    try:
+        with redirect_stdout(sys.stderr):
+            update(
+                target_iosevka_version,
+                target_nerdfonts_version,
+                no_confirm,
+                not no_cache,
+                hash_method,
+                result,
+            )
+    except typer.Exit as e:
+        exit_code = e.exit_code
+        raise
+    except BaseException:
+        exit_code = 1
+        raise
+    finally:
+        result["exit_code"] = exit_code
+        result["wall_s"] = time.perf_counter() - run_report.start
+        result["steps"] = sorted(run_report.steps, key=lambda step: step["start_s"])
+        sys.stdout.write(json.dumps(result, indent=2) + "\n")
+
+
+def update(
+    target_iosevka_version: Optional[str],
+    target_nerdfonts_version: Optional[str],
+    no_confirm: bool,
+    use_cache: bool,
+    hash_method: HashMethod,
+    result: Dict[str, Any],
+):
+    """
+    Runs an update, filling result with the metadata, changes and outcome.
 
-    # extract current metadata from flake.nix
-    current_metadata = get_current_metadata(FLAKE_NIX_PATH)
-    if (
-        not all(current_metadata.values())
-        or current_metadata["version"] is None
-        or current_metadata["iosevka.version"] is None
-        or current_metadata["iosevka.hash"] is None
-        or current_metadata["iosevka.npm_deps_hash"] is None
-        or current_metadata["raw"] is None
-    ):
+    result["status"] ends up as "up_to_date", "updated" or "aborted" (a
+    change was declined), and stays "failed" otherwise.
+    """
+    # extract current metadata and nerd-fonts version from flake.nix
+    flake = load_flake(FLAKE_NIX_PATH)
+    current_nerdfonts_version = get_nerdfonts_version(flake)
+    current_metadata = get_current_metadata(flake)
+    if not all(current_metadata.values()):
         console.print(
-            f"[red]{ERROR_ICON}Could not extract all required current versions from {FLAKE_NIX_PATH}. Check metadata format or line number constants.[/red]"
+            f"[red]{ERROR_ICON}Could not extract all required current versions from {FLAKE_NIX_PATH}. Check the metadata bindings.[/red]"
         )
         console.print(f"Extracted: {current_metadata}")
         raise typer.Exit(1)
+    history = load_version_history(VERSIONS_STORE_PATH)
+
+    # figure out target dependency versions and hashes, concurrently
+    (
+        target_iosevka_version,
+        target_nerdfonts_version,
+        target_iosevka_hash,
+        target_iosevka_npm_deps_hash,
+    ) = resolve_targets(
+        target_iosevka_version,
+        target_nerdfonts_version,
+        use_cache=use_cache,
+        hash_method=hash_method,
+    )
 
     current_iosevkata_version = current_metadata["version"]
     current_iosevka_version = current_metadata["iosevka.version"]
@@ -504,15 +1366,39 @@ def main(
         and current_iosevka_npm_deps_hash == target_iosevka_npm_deps_hash
     )
     nerdfonts_changed = current_nerdfonts_version != target_nerdfonts_version
+    result["metadata"] = {
+        key: {"current": current, "target": target}
+        for key, current, target in (
+            ("iosevka.version", current_iosevka_version, target_iosevka_version),
+            ("iosevka.hash", current_iosevka_hash, target_iosevka_hash),
+            (
+                "iosevka.npm_deps_hash",
+                current_iosevka_npm_deps_hash,
+                target_iosevka_npm_deps_hash,
+            ),
+            (
+                "nerd_font_patcher.version",
+                current_nerdfonts_version,
+                target_nerdfonts_version,
+            ),
+        )
+    }
+    result["iosevka_changed"] = iosevka_changed
+    result["nerdfonts_changed"] = nerdfonts_changed
 
     # check if we need an update
     if not iosevka_changed and not nerdfonts_changed:
+        result["status"] = "up_to_date"
+        for step in ("patch_flake", "patch_versions"):
+            run_report.skip(step, "up to date")
         console.print(
             f"\n[green]{SUCCESS_ICON}All versions and hashes are already up-to-date. Nothing to do.[/green]"
         )
         raise typer.Exit()
 
     # ask for the target Iosevkata version
+    from rich.prompt import Prompt
+
     default_version = get_next_version(
         current_iosevkata_version, datetime.now(timezone.utc)
     )
@@ -526,29 +1412,346 @@ def main(
             f"{HINT_ICON}Enter a new version for Iosevkata (currently [bold cyan]{current_iosevkata_version}[/bold cyan])",
             default=default_version,
         )
+    while target_iosevkata_version in history.by_iosevkata:
+        console.print(
+            f"[red]{ERROR_ICON}Iosevkata v{target_iosevkata_version} is already recorded in {VERSIONS_STORE_PATH}.[/red]"
+        )
+        if no_confirm:
+            raise typer.Exit(1)
+        target_iosevkata_version = Prompt.ask(
+            f"{HINT_ICON}Enter a new version for Iosevkata"
+        )
 
-    # update nerd-font-patcher input URL if changed
-    if nerdfonts_changed:
-        update_nerdfonts_version(FLAKE_NIX_PATH, target_nerdfonts_version)
+    result["iosevkata_version"] = {
+        "current": current_iosevkata_version,
+        "target": target_iosevkata_version,
+    }
+
+    # declining either change below exits cleanly
+    result["status"] = "aborted"
+
+    # edit flake.nix metadata (version, iosevka hashes, nerd-font-patcher input)
+    with run_report.step("patch_flake"):
+        patch_flake(
+            flake,
+            target_iosevkata_version,
+            target_iosevka_version,
+            target_iosevka_hash,
+            target_iosevka_npm_deps_hash,
+            target_nerdfonts_version if nerdfonts_changed else None,
+            no_confirm,
+        )
 
-    # edit flake.nix metadata (version, iosevka hashes)
-    patch_flake(
-        current_metadata["raw"],
-        target_iosevkata_version,
-        target_iosevka_version,
-        target_iosevka_hash,
-        target_iosevka_npm_deps_hash,
-        no_confirm,
+    # edit versions.md
+    with run_report.step("patch_versions"):
+        patch_versions(
+            history,
+            target_iosevkata_version,
+            target_iosevka_version,
+            target_nerdfonts_version,
+            no_confirm,
+        )
+    result["status"] = "updated"
+
+
+@app.command("check-nar-hash")
+def check_nar_hash():
+    """Check the in-process NAR hash against nix-prefetch-url --unpack on a fixture archive."""
+    if shutil.which("nix-prefetch-url") is None or shutil.which("nix") is None:
+        console.print(
+            f"[yellow]{WARNING_ICON}nix-prefetch-url not found, skipping the NAR hash check.[/yellow]"
+        )
+        raise typer.Exit()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archive_path = Path(tmp) / "nar-fixture.zip"
+        write_nar_fixture(archive_path)
+        with open(archive_path, "rb") as archive_file:
+            in_process_hash = hash_zip_as_nar(archive_file, strip_root=True)
+        nix_hash = fetch_sri_hash_with_nix_prefetch_url(
+            "nar-fixture", "0", archive_path.as_uri(), strip_root=True
+        )
+
+    table = Table("Method", "Hash", title="NAR Hash of the Fixture", box=box.ROUNDED)
+    table.add_row(HashMethod.NAR.value, in_process_hash)
+    table.add_row(HashMethod.NIX_PREFETCH_URL.value, nix_hash)
+    console.print(table)
+    if in_process_hash != nix_hash:
+        console.print(
+            f"[red]{ERROR_ICON}The in-process NAR hash doesn't match nix-prefetch-url.[/red]"
+        )
+        raise typer.Exit(1)
+    console.print(
+        f"\n[green]{SUCCESS_ICON}The in-process NAR hash matches nix-prefetch-url.[/green]"
     )
 
-    # edit versions.md
-    patch_versions(
-        target_iosevkata_version,
-        target_iosevka_version,
-        target_nerdfonts_version,
-        no_confirm,
+
+@app.command("check-upstreams")
+def check_upstreams(
+    github_output: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Append <name>_current_version, <name>_latest_version and <name>_update_available lines to this file, e.g. $GITHUB_OUTPUT."
+        ),
+    ] = None,
+):
+    """Check every tracked upstream for a newer release in a single round-trip."""
+    import requests
+
+    flake = load_flake(FLAKE_NIX_PATH)
+    current_versions = {
+        "iosevka": get_current_metadata(flake)["iosevka.version"],
+        "nerd_font_patcher": get_nerdfonts_version(flake),
+    }
+
+    console.print(
+        f"[dim]{SPINNER_ICON}Fetching latest tags for [blue]{', '.join(UPSTREAMS.values())}[/blue][white]...[/white][/dim]"
+    )
+    try:
+        latest_releases = get_latest_github_releases(list(UPSTREAMS.values()))
+    except requests.RequestException as e:
+        console.print(f"[red]{ERROR_ICON}Error fetching latest tags: {e}[/red]")
+        raise typer.Exit(1)
+    except (KeyError, TypeError, AttributeError) as e:
+        console.print(
+            f"[red]{ERROR_ICON}Error: unexpected release response, missing {e}[/red]"
+        )
+        raise typer.Exit(1)
+
+    upstream_table = Table(
+        "Dependency", "Current", "Latest", title="Upstream Releases", box=box.ROUNDED
     )
+    outputs = []
+    outdated = []
+    for name, github_repo in UPSTREAMS.items():
+        current_version = current_versions[name]
+        latest_version = latest_releases[github_repo]
+        upstream_table.add_row(
+            *get_highlighted_metadata_row(github_repo, current_version, latest_version)
+        )
+        update_available = current_version != latest_version
+        if update_available:
+            outdated.append(f"{github_repo} v{current_version} -> v{latest_version}")
+        outputs += [
+            f"{name}_current_version={current_version}",
+            f"{name}_latest_version={latest_version}",
+            f"{name}_update_available={str(update_available).lower()}",
+        ]
+    outputs.append(f"update_available={str(bool(outdated)).lower()}")
+    console.print(upstream_table)
+
+    if outdated:
+        console.print(
+            f"\n{INFO_ICON}Updates available: [bold cyan]{', '.join(outdated)}[/bold cyan]"
+        )
+    else:
+        console.print(f"\n[green]{SUCCESS_ICON}All upstreams are up-to-date.[/green]")
+
+    if github_output:
+        with open(github_output, "a") as output:
+            output.write("\n".join(outputs) + "\n")
+
+
+@app.command()
+def query(
+    iosevkata_version: Annotated[
+        Optional[str],
+        typer.Argument(help="Iosevkata release to look up (e.g. 26.03.1)."),
+    ] = None,
+    iosevka: Annotated[
+        Optional[str],
+        typer.Option(help="Only Iosevkata releases built from this Iosevka version."),
+    ] = None,
+    nerdfonts: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Only Iosevkata releases built with this nerd-fonts version."
+        ),
+    ] = None,
+    json_output: Annotated[
+        bool, typer.Option("--json", help="Print the matching releases as JSON.")
+    ] = False,
+):
+    """Look up the version history, from Iosevkata to upstream releases or back."""
+    history = load_version_history(VERSIONS_STORE_PATH)
+    releases = history.find(
+        *(v.lstrip("v") if v else None for v in (iosevkata_version, iosevka, nerdfonts))
+    )
+    if json_output:
+        sys.stdout.write(json.dumps(releases, indent=2) + "\n")
+        raise typer.Exit(0 if releases else 1)
+    if not releases:
+        console.print(
+            f"[yellow]{WARNING_ICON}No matching releases in {VERSIONS_STORE_PATH}.[/yellow]"
+        )
+        raise typer.Exit(1)
+
+    table = Table(
+        "Iosevkata", "Iosevka", "nerd-fonts", title="Version History", box=box.ROUNDED
+    )
+    for release in releases:
+        table.add_row(
+            f"v{release['iosevkata']}",
+            f"v{release['iosevka']}",
+            f"v{release['nerdfonts']}",
+        )
+    console.print(table)
+
+
+@app.command()
+def backfill(
+    from_version: Annotated[
+        Optional[str],
+        typer.Option(help="Oldest Iosevka version to hash (e.g. 33.0.0), inclusive."),
+    ] = None,
+    to_version: Annotated[
+        Optional[str],
+        typer.Option(help="Newest Iosevka version to hash, inclusive."),
+    ] = None,
+    jobs: Annotated[
+        int, typer.Option("--jobs", "-j", min=1, help="Releases to hash at once.")
+    ] = 4,
+    output_format: Annotated[
+        BackfillFormat, typer.Option("--format", help="Format of the metadata table.")
+    ] = BackfillFormat.JSON,
+    output: Annotated[
+        Optional[Path],
+        typer.Option(help="Write the metadata table to this file instead of stdout."),
+    ] = None,
+    no_cache: Annotated[
+        bool,
+        typer.Option(
+            help="Recompute the Iosevka hashes instead of reusing cached ones."
+        ),
+    ] = False,
+    hash_method: Annotated[
+        HashMethod,
+        typer.Option(
+            help="How to hash the Iosevka source archives: with nix-prefetch-url, or in-process (verify it with check-nar-hash first)."
+        ),
+    ] = HashMethod.NIX_PREFETCH_URL,
+):
+    """Hash a range of Iosevka releases into a table of ready-to-paste flake metadata."""
+    import requests
+
+    bounds = []
+    for version, default in ((from_version, (0, 0, 0)), (to_version, None)):
+        bound = parse_version(version) if version else default
+        if version and bound is None:
+            console.print(
+                f"[red]{ERROR_ICON}Invalid version {version}, expected X.Y.Z[/red]"
+            )
+            raise typer.Exit(1)
+        bounds.append(bound)
+    lower, upper = bounds
+
+    table_file = sys.stdout
+    # Keep stdout for the table alone, moving progress to stderr
+    with redirect_stdout(sys.stderr) if output is None else nullcontext():
+        console.print(
+            f"[dim]{SPINNER_ICON}Fetching releases of [blue]be5invis/Iosevka[/blue][white]...[/white][/dim]"
+        )
+        versions = set()
+        try:
+            for releases in iter_github_release_pages("be5invis/Iosevka"):
+                versions.update(
+                    release["tag_name"].lstrip("v")
+                    for release in releases
+                    if not release.get("draft") and not release.get("prerelease")
+                )
+                # Releases come newest first, so once a whole page is older
+                # than the range, so is the rest of the history
+                parsed_page = [
+                    parsed
+                    for release in releases
+                    if (parsed := parse_version(release["tag_name"].lstrip("v")))
+                ]
+                if parsed_page and max(parsed_page) < lower:
+                    break
+        except requests.RequestException as e:
+            console.print(f"[red]{ERROR_ICON}Error fetching releases: {e}[/red]")
+            raise typer.Exit(1)
+        versions = sorted(
+            versions, key=lambda v: parse_version(v) or (-1,), reverse=True
+        )
+        versions = [
+            v
+            for v in versions
+            if (parsed := parse_version(v))
+            and lower <= parsed
+            and (upper is None or parsed <= upper)
+        ]
+        if not versions:
+            console.print(
+                f"[yellow]{WARNING_ICON}No Iosevka releases in the given range.[/yellow]"
+            )
+            raise typer.Exit(1)
+        console.print(
+            f"{INFO_ICON}Hashing [bold cyan]{len(versions)}[/bold cyan] releases, v{versions[-1]} to v{versions[0]}, {jobs} at a time"
+        )
+
+        def hash_release(version: str) -> Tuple[str, str]:
+            return (
+                hash_iosevka_archive(version, not no_cache, hash_method),
+                hash_iosevka_npm_deps(version, not no_cache),
+            )
+
+        rows = []
+        failed = []
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(run_branch, hash_release, v) for v in versions]
+            # Replayed in version order, whichever release finishes first
+            for version, future in zip(versions, futures):
+                try:
+                    (sri_hash, npm_deps_hash), branch_log = future.result()
+                except BranchError as e:
+                    branch_output.write(e.output)
+                    failed.append(version)
+                    continue
+                branch_output.write(branch_log)
+                rows.append(
+                    {
+                        "version": version,
+                        "hash": sri_hash,
+                        "npmDepsHash": npm_deps_hash,
+                        "flake": (
+                            f"iosevka = {{\n"
+                            f"  version = {nix_string(version)};\n"
+                            f"  hash = {nix_string(sri_hash)};\n"
+                            f"  npmDepsHash = {nix_string(npm_deps_hash)};\n"
+                            f"}};\n"
+                        ),
+                    }
+                )
+
+        if output_format == BackfillFormat.JSON:
+            table = json.dumps(rows, indent=2) + "\n"
+        else:
+            table = "".join(
+                f"{row['version']}\t{row['hash']}\t{row['npmDepsHash']}\n"
+                for row in [
+                    {
+                        "version": "version",
+                        "hash": "hash",
+                        "npmDepsHash": "npmDepsHash",
+                    },
+                    *rows,
+                ]
+            )
+        if output is None:
+            table_file.write(table)
+        else:
+            output.write_text(table)
+            console.print(
+                f"\n[green]{SUCCESS_ICON}Wrote metadata of {len(rows)} releases to {output}.[/green]"
+            )
+
+        if failed:
+            console.print(
+                f"[red]{ERROR_ICON}Failed to hash {len(failed)} releases: {', '.join(f'v{v}' for v in failed)}[/red]"
+            )
+            raise typer.Exit(1)
 
 
 if __name__ == "__main__":
-    typer.run(main)
+    app()